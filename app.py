@@ -8,15 +8,49 @@ DESCRIPTION :
     traitement des données calendaires et routage des pages web.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, g, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from icalendar import Calendar
+from icalendar import Calendar, vRecur
+from dateutil.rrule import rrulestr, rruleset
 from datetime import datetime, timedelta
 import pytz
 import os
 import json
 import locale
 import re
+import threading
+import time
+import heapq
+import asyncio
+import multiprocessing
+import queue
+import csv
+import io
+import mmap
+import struct
+import sys
+import gzip
+import zlib
+import functools
+import random
+import secrets
+import http.client
+import ssl
+from urllib.parse import urlsplit, urlunsplit, urljoin, urlencode, parse_qs
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
+try:
+    import fcntl # Unix : un seul worker gunicorn synchronise les flux distants
+except ImportError:
+    fcntl = None
+try:
+    import brotli # Optionnel : compression br des pages en cache si la librairie est installée
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
@@ -64,7 +98,14 @@ DOSSIER_CIBLE = "salleICS/"
 # Chemins dynamiques basés sur l'emplacement du fichier app.py
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FICHIER_CONFIG = os.path.join(BASE_DIR, "config.json")
-FICHIER_REPORTS = os.path.join(BASE_DIR, "reports.json")
+FICHIER_REPORTS = os.path.join(BASE_DIR, "reports.json")     # Ancien format (lecture seule)
+FICHIER_INCIDENTS = os.path.join(BASE_DIR, "reports.jsonl")  # Journal des signalements (ajout seul)
+# Flux ICS distants à synchroniser dans DOSSIER_CIBLE (optionnel)
+FICHIER_FLUX = os.environ.get('SALLEDISPO_FLUX', os.path.join(BASE_DIR, "flux.json"))
+# Calendriers déjà parsés, relus au démarrage (vide = désactivé)
+FICHIER_SNAPSHOT_ICS = os.environ.get('SALLEDISPO_SNAPSHOT_ICS', os.path.join(BASE_DIR, "calendriers.snap"))
+# Bâtiments supplémentaires, chacun avec son dossier ICS et sa config (optionnel)
+FICHIER_BATIMENTS = os.environ.get('SALLEDISPO_BATIMENTS', os.path.join(BASE_DIR, "batiments.json"))
 
 # Tentative de configuration de la locale en Français pour l'affichage des dates
 try:
@@ -72,33 +113,303 @@ try:
 except:
     pass # Fallback sur la locale par défaut si fr_FR n'est pas installée
 
+# =========================================================
+# 📈 MÉTRIQUES (PROMETHEUS, SERVER-TIMING)
+# =========================================================
+# SALLEDISPO_METRIQUES=1 active le chronométrage des étapes chaudes (histogrammes), l'en-tête
+# Server-Timing et la route /metrics. Désactivé, le décorateur @mesure rend la fonction
+# d'origine telle quelle : aucun coût sur le chemin chaud. Les compteurs d'erreurs restent
+# toujours tenus (événements rares). Les métriques sont propres à chaque processus.
+METRIQUES_ACTIVES = os.environ.get('SALLEDISPO_METRIQUES', '') not in ('', '0')
+BORNES_HISTOGRAMME = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0) # Secondes
+
+class Metriques:
+    """Compteurs et histogrammes en mémoire, exportés au format texte Prometheus."""
+    def __init__(self, bornes=BORNES_HISTOGRAMME):
+        self.bornes = bornes
+        self._compteurs = {}    # (nom, labels) -> valeur
+        self._histogrammes = {} # (nom, labels) -> [comptes par case (+Inf en dernier), somme, nombre]
+        self._aides = {}        # nom -> (type, description)
+        self._verrou = threading.Lock()
+
+    def decrire(self, nom, type_, aide):
+        self._aides[nom] = (type_, aide)
+
+    def incrementer(self, nom, labels=(), valeur=1):
+        """labels : tuple de paires (clé, valeur)."""
+        with self._verrou:
+            self._compteurs[(nom, labels)] = self._compteurs.get((nom, labels), 0) + valeur
+
+    def observer(self, nom, labels, duree):
+        with self._verrou:
+            h = self._histogrammes.get((nom, labels))
+            if h is None:
+                h = self._histogrammes[(nom, labels)] = [[0] * (len(self.bornes) + 1), 0.0, 0]
+            h[0][bisect_left(self.bornes, duree)] += 1
+            h[1] += duree
+            h[2] += 1
+
+    @staticmethod
+    def _labels(labels):
+        if not labels: return ""
+        echapper = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return "{" + ",".join(f'{k}="{echapper(v)}"' for k, v in labels) + "}"
+
+    def exporter(self, jauges=()):
+        """Texte Prometheus. 'jauges' : liste de (nom, labels, valeur) calculées au moment de l'export."""
+        lignes, decrits = [], set()
+        def entete(nom, type_defaut):
+            if nom in decrits: return
+            decrits.add(nom)
+            type_, aide = self._aides.get(nom, (type_defaut, ""))
+            if aide: lignes.append(f"# HELP {nom} {aide}")
+            lignes.append(f"# TYPE {nom} {type_}")
+        with self._verrou:
+            compteurs = sorted(self._compteurs.items())
+            histogrammes = sorted((cle, (list(h[0]), h[1], h[2])) for cle, h in self._histogrammes.items())
+        for (nom, labels), valeur in compteurs:
+            entete(nom, "counter")
+            lignes.append(f"{nom}{self._labels(labels)} {valeur}")
+        for nom, labels, valeur in sorted(jauges, key=lambda j: j[0]): # Une famille = un bloc contigu
+            entete(nom, "gauge")
+            lignes.append(f"{nom}{self._labels(labels)} {valeur}")
+        for (nom, labels), (comptes, somme, nombre) in histogrammes:
+            entete(nom, "histogram")
+            cumul = 0
+            for borne, compte in zip(self.bornes + ("+Inf",), comptes):
+                cumul += compte
+                lignes.append(f"{nom}_bucket{self._labels(labels + (('le', borne),))} {cumul}")
+            lignes.append(f"{nom}_sum{self._labels(labels)} {somme:.6f}")
+            lignes.append(f"{nom}_count{self._labels(labels)} {nombre}")
+        return "\n".join(lignes) + "\n"
+
+METRIQUES = Metriques()
+METRIQUES.decrire("salledispo_etape_duree_secondes", "histogram", "Durée des étapes chaudes (statut, dispo, planning, rendu...)")
+METRIQUES.decrire("salledispo_requete_duree_secondes", "histogram", "Durée des requêtes HTTP par route")
+METRIQUES.decrire("salledispo_requetes_total", "counter", "Requêtes HTTP par route et code de réponse")
+METRIQUES.decrire("salledispo_erreurs_total", "counter", "Erreurs par catégorie (parsing ICS, config, tâche de fond...)")
+METRIQUES.decrire("salledispo_cache_hits_total", "counter", "Lectures servies par un cache")
+METRIQUES.decrire("salledispo_cache_misses_total", "counter", "Lectures absentes d'un cache")
+METRIQUES.decrire("salledispo_cache_entrees", "gauge", "Entrées présentes dans un cache")
+METRIQUES.decrire("salledispo_clients_sse", "gauge", "Écrans TV connectés au flux SSE")
+
+def mesure(etape):
+    """
+    Décorateur : chronomètre la fonction (histogramme par étape) et cumule sa durée dans
+    l'en-tête Server-Timing de la requête en cours. Sans effet si les métriques sont désactivées.
+    """
+    def decorateur(fonction):
+        if not METRIQUES_ACTIVES: return fonction
+        labels = (("etape", etape),)
+        @functools.wraps(fonction)
+        def chronometree(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                duree = time.perf_counter() - t
+                METRIQUES.observer("salledispo_etape_duree_secondes", labels, duree)
+                if has_request_context():
+                    cumul = g.setdefault('server_timing', {}).setdefault(etape, [0.0, 0])
+                    cumul[0] += duree
+                    cumul[1] += 1
+        return chronometree
+    return decorateur
+
+def journaliser_erreur(categorie, message):
+    """Affiche l'erreur dans la console et l'ajoute au compteur salledispo_erreurs_total."""
+    print(f"❌ {message}")
+    METRIQUES.incrementer("salledispo_erreurs_total", (("categorie", categorie),))
+
+# Rendu des templates chronométré à chaque appel (toutes les routes passent par ce nom)
+render_template = mesure("render_template")(render_template)
+
 # =========================================================
 # 🛠️ FONCTIONS UTILITAIRES (HELPERS)
 # =========================================================
 
-def get_reports(nom_salle):
-    """Récupère la liste des incidents signalés pour une salle spécifique."""
-    if not os.path.exists(FICHIER_REPORTS): return []
-    try:
-        with open(FICHIER_REPORTS, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get(nom_salle, [])
-    except: return []
+class CacheLRU:
+    """Petit cache clé -> valeur borné en nombre d'entrées (éviction LRU), partagé entre threads."""
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self.hits = 0
+        self.misses = 0
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle):
+        """Valeur associée à la clé, ou None si absente."""
+        with self._verrou:
+            valeur = self._entrees.get(cle)
+            if valeur is None:
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return valeur
 
-def add_report(nom_salle, type_pb, description):
+    def set(self, cle, valeur):
+        with self._verrou:
+            self._entrees[cle] = valeur
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def stats(self):
+        with self._verrou:
+            return {"taille": len(self._entrees), "taille_max": self.taille_max,
+                    "hits": self.hits, "misses": self.misses}
+
+DELAI_SYNCHRO_INCIDENTS = 1.0 # Secondes entre deux vérifications du journal (écritures des autres processus)
+
+class RegistreIncidents:
     """
-    Enregistre un nouveau signalement d'incident dans le fichier JSON.
-    Gère la persistance des données sans base de données SQL.
+    Stockage des signalements sans base SQL, sous forme de journal en ajout seul :
+    une ligne JSON par incident, et une ligne {"salle", "resolu": id} par incident résolu.
+    Chaque ajout est un unique write() en mode O_APPEND, donc sans réécriture du fichier
+    et sans mélange entre processus concurrents.
+    En mémoire : incidents par salle et nombre d'incidents ouverts par salle. Le journal n'est
+    relu que pour les octets ajoutés depuis la dernière lecture (autres workers).
+    L'ancien fichier reports.json est repris tel quel, en lecture seule (ses incidents restent résolubles).
     """
-    data = {}
-    if os.path.exists(FICHIER_REPORTS):
+    def __init__(self, chemin_journal, chemin_historique):
+        self.chemin_journal = chemin_journal
+        self.chemin_historique = chemin_historique
+        self._historique = None  # nom -> incidents de reports.json (plus récents en premier)
+        self._journal = {}       # nom -> incidents du journal (ordre d'ajout)
+        self._par_id = {}        # id -> incident (journal et historique)
+        self._ouverts = {}       # nom -> nombre d'incidents non résolus
+        self._resolus = set()    # id résolus (y compris avant que l'incident ne soit lu)
+        self._position = 0       # Octets du journal déjà lus
+        self._derniere_synchro = 0.0
+        self._verrou = threading.Lock()
+
+    def _charger_historique(self):
+        self._historique = {}
+        if not os.path.exists(self.chemin_historique): return
         try:
-            with open(FICHIER_REPORTS, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(self.chemin_historique, 'r', encoding='utf-8') as f:
+                self._historique = json.load(f)
         except: pass
-    
-    if nom_salle not in data: data[nom_salle] = []
-    
+        for salle, incidents in self._historique.items():
+            for i, incident in enumerate(incidents):
+                # Fichier figé : la position suffit à identifier un ancien incident
+                self._enregistrer(salle, incident, f"h-{salle}-{i}")
+
+    def _enregistrer(self, salle, incident, id_defaut):
+        """Indexe un incident lu (appel sous verrou)."""
+        incident.setdefault('id', id_defaut)
+        incident['resolu'] = incident['id'] in self._resolus
+        self._par_id[incident['id']] = (salle, incident)
+        if not incident['resolu']:
+            self._ouverts[salle] = self._ouverts.get(salle, 0) + 1
+
+    def _resoudre(self, id_incident):
+        """Marque un incident comme résolu en mémoire (appel sous verrou)."""
+        if id_incident in self._resolus: return
+        self._resolus.add(id_incident)
+        salle, incident = self._par_id.get(id_incident, (None, None))
+        if incident is not None:
+            incident['resolu'] = True
+            self._ouverts[salle] -= 1
+
+    def _synchroniser(self, force=False):
+        """Intègre les lignes ajoutées au journal depuis la dernière lecture (appel sous verrou)."""
+        if self._historique is None: self._charger_historique()
+        maintenant = time.monotonic()
+        if not force and maintenant - self._derniere_synchro < DELAI_SYNCHRO_INCIDENTS: return
+        self._derniere_synchro = maintenant
+
+        try: taille = os.path.getsize(self.chemin_journal)
+        except OSError: return
+        if taille < self._position: # Journal tronqué ou remplacé : on repart de zéro
+            self._journal, self._position, self._resolus = {}, 0, set()
+            self._par_id, self._ouverts, self._historique = {}, {}, None
+            self._charger_historique()
+        if taille == self._position: return
+
+        with open(self.chemin_journal, 'rb') as f:
+            f.seek(self._position)
+            donnees = f.read(taille - self._position)
+        complet = donnees.rfind(b'\n') + 1 # Une ligne en cours d'écriture sera lue la prochaine fois
+        debut = 0
+        while debut < complet:
+            fin = donnees.index(b'\n', debut)
+            ligne, position, debut = donnees[debut:fin], self._position + debut, fin + 1
+            # Ligne tronquée (écriture interrompue) : JSON invalide, ignorée
+            try: incident = json.loads(ligne)
+            except ValueError: continue
+            if not isinstance(incident, dict): continue
+            salle = incident.pop('salle', None)
+            if salle is None: continue
+            if 'resolu' in incident:
+                self._resoudre(incident['resolu'])
+                continue
+            self._journal.setdefault(salle, []).append(incident)
+            self._enregistrer(salle, incident, f"j-{position}") # Anciennes lignes sans id : leur position
+        self._position += complet
+
+    def lister(self, nom_salle):
+        """Incidents d'une salle (ouverts et résolus, clé 'resolu'), les plus récents en premier."""
+        with self._verrou:
+            self._synchroniser()
+            return list(reversed(self._journal.get(nom_salle, []))) + self._historique.get(nom_salle, [])
+
+    def nombre_ouverts(self, nom_salle):
+        """Nombre d'incidents non résolus pour une salle (O(1), sans lecture de fichier)."""
+        with self._verrou:
+            self._synchroniser()
+            return self._ouverts.get(nom_salle, 0)
+
+    def version(self):
+        """Marqueur qui change à chaque nouvel incident ou résolution (octets du journal déjà intégrés)."""
+        with self._verrou:
+            self._synchroniser()
+            return self._position
+
+    def _ecrire(self, enregistrement):
+        """Ajoute une ligne au journal par un write() atomique en fin de fichier."""
+        ligne = (json.dumps(enregistrement, ensure_ascii=False) + "\n").encode('utf-8')
+        fd = os.open(self.chemin_journal, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # Dernière ligne tronquée (processus interrompu en pleine écriture) : on la termine,
+            # sinon elle absorberait cet enregistrement
+            taille = os.fstat(fd).st_size
+            if taille and os.pread(fd, 1, taille - 1) != b'\n':
+                ligne = b'\n' + ligne
+            os.write(fd, ligne)
+        finally:
+            os.close(fd)
+        with self._verrou:
+            self._synchroniser(force=True)
+
+    def ajouter(self, nom_salle, incident):
+        """Ajoute un incident au journal. Retourne son identifiant."""
+        id_incident = secrets.token_hex(8)
+        self._ecrire({"salle": nom_salle, "id": id_incident, **incident})
+        return id_incident
+
+    def resoudre(self, nom_salle, id_incident, **details):
+        """Marque un incident de la salle comme résolu. Retourne False s'il n'existe pas ou l'est déjà."""
+        with self._verrou:
+            self._synchroniser(force=True)
+            salle, incident = self._par_id.get(id_incident, (None, None))
+            if salle != nom_salle or incident['resolu']: return False
+        self._ecrire({"salle": nom_salle, "resolu": id_incident, **details})
+        return True
+
+REGISTRE_INCIDENTS = RegistreIncidents(FICHIER_INCIDENTS, FICHIER_REPORTS)
+
+@mesure("get_reports")
+def get_reports(nom_salle, batiment=None):
+    """Récupère la liste des incidents signalés pour une salle spécifique."""
+    return REGISTRE_INCIDENTS.lister((batiment or BATIMENT_DEFAUT).cle_salle(nom_salle))
+
+def add_report(nom_salle, type_pb, description, batiment=None):
+    """
+    Enregistre un nouveau signalement d'incident dans le journal des incidents.
+    Gère la persistance des données sans base de données SQL.
+    """
     # Détermine l'auteur : User ID si connecté, sinon "Public/TV"
     auteur = "Public/TV"
     if current_user.is_authenticated:
@@ -110,29 +421,26 @@ def add_report(nom_salle, type_pb, description):
         "date": datetime.now().strftime("%d/%m à %H:%M"),
         "auteur": auteur
     }
-    # Insertion en début de liste pour avoir les plus récents en premier
-    data[nom_salle].insert(0, nouveau)
-    
-    with open(FICHIER_REPORTS, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    REGISTRE_INCIDENTS.ajouter((batiment or BATIMENT_DEFAUT).cle_salle(nom_salle), nouveau)
+
+def close_report(nom_salle, id_incident, batiment=None):
+    """Marque un incident comme résolu (il reste dans l'historique). Retourne False s'il est introuvable."""
+    return REGISTRE_INCIDENTS.resoudre((batiment or BATIMENT_DEFAUT).cle_salle(nom_salle), id_incident,
+                                       date=datetime.now().strftime("%d/%m à %H:%M"), auteur=current_user.id)
 
-def get_infos_manuelles(nom_salle):
+@mesure("get_infos_manuelles")
+def get_infos_manuelles(nom_salle, batiment=None):
     """
-    Charge les métadonnées statiques d'une salle (places, équipements) 
-    depuis le fichier config.json.
+    Retourne les métadonnées statiques d'une salle (places, équipements, localisation)
+    issues du config.json de son bâtiment, via le registre des salles (aucune lecture de fichier ici).
     """
-    default = {"nom_complet": f"Salle {nom_salle}", "places": "?", "pc": False, "projecteur": False, "description": "Pas d'info."}
-    if not os.path.exists(FICHIER_CONFIG): return default
-    try:
-        with open(FICHIER_CONFIG, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get(nom_salle, default)
-    except: return default
+    return (batiment or BATIMENT_DEFAUT).registre.get(nom_salle)
 
 def detecter_etage_aile(nom_simple, infos):
     """
     Algorithme heuristique pour déterminer l'étage et l'aile d'une salle
     basé sur son numéro (ex: 204 -> 2ème étage) ou la configuration manuelle.
+    Chaque bâtiment a son propre config.json : l'heuristique s'applique bâtiment par bâtiment.
     """
     etage = 0
     if "etage" in infos: etage = int(infos["etage"])
@@ -149,193 +457,1919 @@ def detecter_etage_aile(nom_simple, infos):
             aile = "droite" if num % 2 == 0 else "gauche"
     return etage, aile
 
+@dataclass(frozen=True, slots=True)
+class Salle:
+    """Fiche immuable d'une salle : métadonnées de config.json + étage/aile précalculés."""
+    nom: str
+    nom_complet: str
+    places: object # Nombre de places, ou "?" si inconnu
+    pc: bool
+    projecteur: bool
+    tableau: bool
+    description: str
+    etage: int
+    aile: str
+
+def creer_salle(nom_salle, data):
+    """Construit la fiche d'une salle à partir de son entrée config.json (éventuellement vide)."""
+    etage, aile = detecter_etage_aile(nom_salle, data)
+    return Salle(nom=nom_salle,
+                 nom_complet=data.get("nom_complet", f"Salle {nom_salle}"),
+                 places=data.get("places", "?"),
+                 pc=bool(data.get("pc", False)),
+                 projecteur=bool(data.get("projecteur", False)),
+                 tableau=bool(data.get("tableau", False)),
+                 description=data.get("description", "Pas d'info."),
+                 etage=etage, aile=aile)
+
+DELAI_VERIF_CONFIG = 1.0 # Secondes entre deux vérifications de la date de modification de config.json
+
+class RegistreSalles:
+    """
+    Registre des salles : config.json est lu une seule fois, puis rechargé uniquement
+    quand sa date de modification ou sa taille change. Les fiches sont partagées
+    (immuables) : aucune copie ni lecture de fichier par requête.
+    """
+    def __init__(self, chemin_config):
+        self.chemin_config = chemin_config
+        self._salles = {}         # nom -> Salle (salles déclarées dans config.json)
+        self._signature = None    # (mtime, taille) de la config chargée
+        self.generation = 0       # Incrémenté à chaque rechargement (invalide les index dérivés)
+        self._derniere_verif = 0.0
+        self._verrou = threading.Lock()
+
+    def _recharger_si_modifie(self):
+        maintenant = time.monotonic()
+        if maintenant - self._derniere_verif < DELAI_VERIF_CONFIG: return
+        self._derniere_verif = maintenant
+        try:
+            st = os.stat(self.chemin_config)
+            signature = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            signature = None
+        if signature == self._signature and (self._salles or signature is None): return
+
+        salles = {}
+        if signature is not None:
+            try:
+                with open(self.chemin_config, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Les clés commençant par "_" sont des commentaires (ex : "_README")
+                salles = {nom: creer_salle(nom, infos) for nom, infos in data.items() if not nom.startswith('_')}
+            except Exception as e:
+                # Config en cours d'édition ou invalide : on garde la version précédente
+                journaliser_erreur("config", f"Erreur lecture {self.chemin_config} : {e}")
+                return
+        self._salles = salles
+        self._signature = signature
+        self.generation += 1
+
+    def verifier(self):
+        """Recharge config.json si besoin et retourne la génération courante du registre."""
+        with self._verrou:
+            self._recharger_si_modifie()
+            return self.generation
+
+    def get(self, nom_salle):
+        """Fiche de la salle ; fiche par défaut si elle est absente de config.json."""
+        with self._verrou:
+            self._recharger_si_modifie()
+            salle = self._salles.get(nom_salle)
+        # Fiche par défaut non conservée : les noms viennent aussi de l'URL (/salle/<x>, /api/salle/<x>)
+        return salle if salle is not None else creer_salle(nom_salle, {})
+
+def ngrammes(texte, n_max=3):
+    """Toutes les sous-chaînes de 1 à n_max caractères d'un texte."""
+    return {texte[i:i + n] for n in range(1, n_max + 1) for i in range(len(texte) - n + 1)}
+
+class IndexFiltres:
+    """
+    Index inversés précalculés pour les filtres du tableau de bord : un ensemble de
+    fichiers par étage, par aile et par équipement, et un index de n-grammes (1 à 3
+    caractères) des noms pour la recherche 'q'. Un filtrage devient une intersection
+    d'ensembles ; seules les salles restantes passent ensuite le test de créneau.
+    """
+    def __init__(self, fichiers, cle, batiment=None):
+        self.cle = cle
+        self.tous = set(fichiers)
+        self.noms = {}             # fichier -> nom simple
+        self.par_etage = {}        # "1" -> {fichiers}
+        self.par_aile = {}         # "gauche" -> {fichiers}
+        self.avec_pc = set()
+        self.avec_projecteur = set()
+        self.ngrammes = {}         # sous-chaîne (minuscules) -> {fichiers}
+        for f in fichiers:
+            nom_simple = f.replace('.ics', '').replace('.ICS', '')
+            infos = get_infos_manuelles(nom_simple, batiment)
+            self.noms[f] = nom_simple
+            self.par_etage.setdefault(str(infos.etage), set()).add(f)
+            self.par_aile.setdefault(infos.aile, set()).add(f)
+            if infos.pc: self.avec_pc.add(f)
+            if infos.projecteur: self.avec_projecteur.add(f)
+            for g in ngrammes(nom_simple.lower()):
+                self.ngrammes.setdefault(g, set()).add(f)
+
+    def recherche(self, q):
+        """Fichiers dont le nom contient q (insensible à la casse)."""
+        q = q.lower()
+        if len(q) <= 3: return self.ngrammes.get(q, set())
+        # Intersection des trigrammes, puis vérification (les trigrammes peuvent être dans le désordre)
+        candidats = set.intersection(*(self.ngrammes.get(g, set()) for g in ngrammes(q, 3) if len(g) == 3))
+        return {f for f in candidats if q in self.noms[f].lower()}
+
+    def filtrer(self, q=None, pc=False, projecteur=False, etage=None, aile=None):
+        """Fichiers qui passent tous les filtres statiques, triés par nom."""
+        ensembles = []
+        if q: ensembles.append(self.recherche(q))
+        if pc: ensembles.append(self.avec_pc)
+        if projecteur: ensembles.append(self.avec_projecteur)
+        if etage: ensembles.append(self.par_etage.get(etage, set()))
+        if aile: ensembles.append(self.par_aile.get(aile, set()))
+        # On part du plus petit ensemble pour des intersections moins coûteuses
+        ensembles.sort(key=len)
+        resultat = set.intersection(*ensembles) if ensembles else self.tous
+        return sorted(resultat, key=self.noms.get)
+
+def obtenir_index_filtres(fichiers, batiment=None):
+    """Index des filtres du bâtiment pour cette liste de fichiers, reconstruit si les fichiers ou son config.json changent."""
+    batiment = batiment or BATIMENT_DEFAUT
+    cle = (tuple(fichiers), batiment.registre.verifier())
+    index = batiment.index_filtres
+    if index is None or index.cle != cle:
+        index = batiment.index_filtres = IndexFiltres(fichiers, cle, batiment)
+    return index
+
+# =========================================================
+# ⚡ CACHE DES CALENDRIERS ICS
+# =========================================================
+# Le parsing icalendar est coûteux (pur Python). On garde donc en mémoire, pour chaque
+# fichier, un index des événements déjà normalisés sur le fuseau Paris.
+# Une entrée est invalidée dès que la date de modification ou la taille du fichier change.
+TAILLE_MAX_CACHE_ICS = 512 # Fichiers gardés en mémoire en plus de ceux surveillés par la tâche de fond (éviction LRU au-delà)
+
+# Les règles RRULE ne sont développées qu'à la demande, jour par jour, et jamais au-delà
+# de cet horizon (autour de maintenant) : inutile de matérialiser toute l'année universitaire.
+HORIZON_RECURRENCES_JOURS = 366
+TAILLE_MAX_JOURS_DEVELOPPES = 62 # Jours développés gardés en mémoire par salle (éviction LRU)
+# Les cours terminés depuis plus longtemps ne sont pas chargés (les exports ADE gardent des années d'historique)
+RETENTION_EVENEMENTS_JOURS = int(os.environ.get('SALLEDISPO_RETENTION_JOURS', 366))
+
+# Événement normalisé : 'fin' vaut None si le VEVENT n'a pas de DTEND
+# (affiché au planning, mais sans effet sur l'occupation de la salle)
+Evenement = namedtuple('Evenement', ['debut', 'fin', 'titre'])
+FIN_AUCUNE = -(1 << 62) # fin_max tant qu'aucun événement non ponctuel n'a été vu
+
+# Série récurrente "brute" (types simples uniquement), développée à la demande par CalendrierSalle.
+# Les dates sont naïves, en heure murale du fuseau 'fuseau' : un cours à 13h45 reste à 13h45
+# après le passage à l'heure d'été. 'duree' est en secondes.
+Recurrence = namedtuple('Recurrence', ['debut', 'fuseau', 'duree', 'rrules', 'exdates', 'rdates', 'titre'])
+
+def normaliser_date(dt, tz):
+    """
+    Convertit une date ICS en DateTime localisé sur le fuseau donné.
+    Les événements "Journée entière" (Date) sont ramenés à minuit (compatibilité Google Calendar).
+    """
+    if not isinstance(dt, datetime):
+        return tz.localize(datetime.combine(dt, datetime.min.time()))
+    if dt.tzinfo is None:
+        return tz.localize(dt)
+    return dt.astimezone(tz)
+
+def heure_murale(dt, tz):
+    """Convertit une date ICS en DateTime naïve exprimée dans le fuseau tz (heure affichée à l'horloge)."""
+    if not isinstance(dt, datetime):
+        return datetime.combine(dt, datetime.min.time())
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(tz).replace(tzinfo=None)
+
+def _liste_propriete(component, nom):
+    """Une propriété ICS peut apparaître plusieurs fois : on retourne toujours une liste."""
+    valeur = component.get(nom)
+    if valeur is None: return []
+    return valeur if isinstance(valeur, list) else [valeur]
+
+def _dates_propriete(component, nom, tz):
+    """Dates (heure murale de tz) d'une propriété multi-valuée comme EXDATE ou RDATE."""
+    dates = []
+    for liste in _liste_propriete(component, nom):
+        for d in liste.dts:
+            if isinstance(d.dt, tuple): continue # RDATE;VALUE=PERIOD : non géré
+            dates.append(heure_murale(d.dt, tz))
+    return dates
+
+def _lire_recurrence(component, titre, remplacees):
+    """
+    Extrait la série récurrente d'un VEVENT maître (RRULE/RDATE).
+    'remplacees' : dates RECURRENCE-ID des occurrences déplacées ou annulées, exclues de la série.
+    """
+    tz_paris = pytz.timezone('Europe/Paris')
+    dtstart = component.get('dtstart').dt
+    tz = tz_paris
+    if isinstance(dtstart, datetime) and dtstart.tzinfo is not None and hasattr(dtstart.tzinfo, 'zone'):
+        tz = dtstart.tzinfo # Fuseau pytz d'origine (TZID ou UTC)
+    debut = heure_murale(dtstart, tz)
+
+    # Durée d'une occurrence : DURATION, sinon DTEND - DTSTART, sinon ponctuelle
+    duree = timedelta(0)
+    if component.get('duration') is not None:
+        duree = component.get('duration').dt
+    elif component.get('dtend') is not None:
+        duree = normaliser_date(component.get('dtend').dt, tz_paris) - normaliser_date(dtstart, tz_paris)
+
+    rrules = []
+    for regle in _liste_propriete(component, 'rrule'):
+        regle = vRecur(regle)
+        if 'UNTIL' in regle:
+            # dateutil exige un UNTIL du même "type" que DTSTART (ici : naïf, heure murale)
+            regle['UNTIL'] = [heure_murale(u, tz) if isinstance(u, datetime)
+                              else datetime.combine(u, datetime.max.time()).replace(microsecond=0)
+                              for u in regle['UNTIL']]
+        rrules.append(regle.to_ical().decode())
+
+    exdates = _dates_propriete(component, 'exdate', tz) + [heure_murale(d, tz) for d in remplacees]
+    rdates = _dates_propriete(component, 'rdate', tz)
+    return Recurrence(debut, tz.zone, int(duree.total_seconds()), rrules, exdates, rdates, titre)
+
+class ContenuIcsExotique(ValueError):
+    """Contenu que le lecteur en flux ne sait pas interpréter : le fichier repasse par icalendar."""
+
+# Propriétés de VEVENT réservées au parsing complet (séries récurrentes, durées)
+PROPRIETES_ICS_EXOTIQUES = {b'RRULE', b'RDATE', b'EXDATE', b'EXRULE', b'RECURRENCE-ID', b'DURATION'}
+
+def _lignes_depliees(f):
+    """Lignes logiques d'un flux ICS binaire : les lignes qui commencent par un espace prolongent la précédente."""
+    courante = None
+    for ligne in f:
+        ligne = ligne.rstrip(b'\r\n')
+        if ligne[:1] in (b' ', b'\t'):
+            if courante is not None: courante += ligne[1:]
+            continue
+        if courante is not None: yield courante
+        courante = ligne
+    if courante is not None: yield courante
+
+def _separer_ligne(ligne):
+    """Découpe 'NOM;PARAM=X:valeur' en (NOM, paramètres bruts, valeur). Les ':' entre guillemets sont ignorés."""
+    i = ligne.find(b':')
+    if i < 0: return ligne.upper(), b'', b''
+    if b'"' in ligne[:i]:
+        dans_guillemets = False
+        for i, c in enumerate(ligne):
+            if c == 0x22: dans_guillemets = not dans_guillemets
+            elif c == 0x3A and not dans_guillemets: break
+    tete = ligne[:i]
+    j = tete.find(b';')
+    if j < 0: return tete.upper(), b'', ligne[i + 1:]
+    return tete[:j].upper(), tete[j + 1:], ligne[i + 1:]
+
+def _date_ics(parametres, valeur, tz):
+    """
+    Date d'une propriété DTSTART/DTEND (UTC 'Z', TZID ou heure flottante), normalisée sur
+    le fuseau tz comme le fait normaliser_date.
+    """
+    v = valeur.strip().decode('ascii', 'replace')
+    if len(v) == 8:
+        return normaliser_date(datetime(int(v[0:4]), int(v[4:6]), int(v[6:8])).date(), tz)
+    if len(v) not in (15, 16) or v[8] != 'T':
+        raise ContenuIcsExotique(f"date non gérée : {v}")
+    dt = datetime(int(v[0:4]), int(v[4:6]), int(v[6:8]), int(v[9:11]), int(v[11:13]), int(v[13:15]))
+    if v.endswith('Z'): return pytz.utc.localize(dt).astimezone(tz)
+    for parametre in parametres.split(b';'):
+        if parametre.upper().startswith(b'TZID='):
+            try:
+                fuseau = pytz.timezone(parametre[5:].strip(b'"').decode())
+            except pytz.UnknownTimeZoneError:
+                raise ContenuIcsExotique(f"fuseau non géré : {parametre[5:]}")
+            return fuseau.localize(dt) if fuseau is tz else fuseau.localize(dt).astimezone(tz)
+    return tz.localize(dt) # Heure flottante
+
+ECHAPPEMENTS_TEXTE_ICS = {'n': '\n', 'N': '\n', ',': ',', ';': ';', '\\': '\\'}
+MOTIF_ECHAPPEMENT_ICS = re.compile(r'\\(.)', re.DOTALL)
+
+def _texte_ics(valeur):
+    """Valeur TEXT déséchappée en une seule passe (RFC 5545) : une barre échappée suivie de n reste telle quelle."""
+    return MOTIF_ECHAPPEMENT_ICS.sub(lambda m: ECHAPPEMENTS_TEXTE_ICS.get(m.group(1), m.group(0)),
+                                     valeur.decode('utf-8', 'replace'))
+
+def lire_calendrier_flux(chemin, seuil=None):
+    """
+    Lecteur ICS en flux, ligne à ligne : ne retient que DTSTART / DTEND / SUMMARY des VEVENT,
+    sans construire l'arbre de composants. Les événements terminés avant la date 'seuil'
+    sont écartés sur le texte brut de DTEND, sans être décodés.
+    Lève ContenuIcsExotique dès que le fichier sort de ce cadre (séries récurrentes, fuseau inconnu...).
+    """
+    tz_paris = pytz.timezone('Europe/Paris')
+    # Marge d'un jour : la date brute peut être en UTC ou dans un autre fuseau
+    seuil_brut = (seuil - timedelta(days=1)).strftime('%Y%m%d').encode() if seuil else None
+    evenements = []
+    dates = {} # Valeur brute -> date normalisée : les exports répètent les mêmes horaires de créneaux
+    calendrier_vu = False
+    proprietes = None # Propriétés utiles du VEVENT en cours de lecture
+    profondeur = 0    # Sous-composants d'un VEVENT (VALARM...) : ignorés
+
+    with open(chemin, 'rb') as f:
+        for ligne in _lignes_depliees(f):
+            nom, parametres, valeur = _separer_ligne(ligne)
+            if nom == b'BEGIN':
+                valeur = valeur.strip().upper()
+                if valeur == b'VCALENDAR': calendrier_vu = True
+                elif proprietes is not None: profondeur += 1
+                elif valeur == b'VEVENT': proprietes = {}
+                continue
+            if proprietes is None: continue
+            if nom == b'END':
+                if profondeur:
+                    profondeur -= 1
+                elif valeur.strip().upper() == b'VEVENT':
+                    if b'DTSTART' in proprietes:
+                        fin_brute = proprietes.get(b'DTEND', proprietes[b'DTSTART'])[1].strip()
+                        if seuil_brut is None or fin_brute[:8] >= seuil_brut:
+                            debut = dates.get(proprietes[b'DTSTART'])
+                            if debut is None:
+                                debut = dates[proprietes[b'DTSTART']] = _date_ics(*proprietes[b'DTSTART'], tz_paris)
+                            fin = None
+                            if b'DTEND' in proprietes:
+                                fin = dates.get(proprietes[b'DTEND'])
+                                if fin is None:
+                                    fin = dates[proprietes[b'DTEND']] = _date_ics(*proprietes[b'DTEND'], tz_paris)
+                            # SUMMARY absent : même rendu que str(None) côté icalendar
+                            titre = _texte_ics(proprietes[b'SUMMARY'][1]) if b'SUMMARY' in proprietes else 'None'
+                            evenements.append(Evenement(debut, fin, titre))
+                    proprietes = None
+                continue
+            if profondeur: continue
+            if nom in PROPRIETES_ICS_EXOTIQUES:
+                raise ContenuIcsExotique(f"propriété {nom.decode()}")
+            if nom in (b'DTSTART', b'DTEND', b'SUMMARY'):
+                if b'VALUE=PERIOD' in parametres.upper(): raise ContenuIcsExotique("période")
+                proprietes[nom] = (parametres, valeur)
+
+    if not calendrier_vu: raise ContenuIcsExotique("pas de VCALENDAR")
+    return evenements
+
+def lire_calendrier(chemin):
+    """
+    Parse un fichier ICS. Retourne (evenements, recurrences) :
+    - evenements : VEVENT simples normalisés (fuseau Paris), y compris les occurrences
+      modifiées d'une série (RECURRENCE-ID) ;
+    - recurrences : séries RRULE/RDATE, développées plus tard à la demande.
+    Les exports simples passent par le lecteur en flux ; le reste par icalendar.
+    Les cours terminés avant la fenêtre de rétention sont écartés.
+    """
+    seuil = datetime.now(pytz.timezone('Europe/Paris')).date() - timedelta(days=RETENTION_EVENEMENTS_JOURS)
+    try:
+        return lire_calendrier_flux(chemin, seuil), []
+    except ContenuIcsExotique:
+        pass
+    evenements, recurrences = lire_calendrier_icalendar(chemin)
+    evenements = [ev for ev in evenements if (ev.fin or ev.debut).date() >= seuil]
+    return evenements, recurrences
+
+def _titres_bruts(donnees):
+    """SUMMARY brut (encore échappé) de chaque VEVENT, dans l'ordre du fichier ; None si absent."""
+    titres = []
+    dans_vevent = False
+    profondeur = 0 # Sous-composants d'un VEVENT (VALARM...) : ignorés, comme dans lire_calendrier_flux
+    for ligne in _lignes_depliees(io.BytesIO(donnees)):
+        nom, _, valeur = _separer_ligne(ligne)
+        if nom == b'BEGIN':
+            if dans_vevent: profondeur += 1
+            elif valeur.strip().upper() == b'VEVENT':
+                dans_vevent = True
+                titres.append(None)
+        elif nom == b'END' and dans_vevent:
+            if profondeur: profondeur -= 1
+            else: dans_vevent = False
+        elif nom == b'SUMMARY' and dans_vevent and not profondeur:
+            titres[-1] = valeur
+    return titres
+
+def lire_calendrier_icalendar(chemin):
+    """Parsing complet par icalendar (séries récurrentes, fuseaux non standard...). Même retour que lire_calendrier."""
+    with open(chemin, 'rb') as f:
+        donnees = f.read()
+    cal = Calendar.from_ical(donnees)
+
+    tz_paris = pytz.timezone('Europe/Paris')
+    evenements = []
+    maitres = []
+    remplacees = {} # UID -> dates RECURRENCE-ID
+    # Titres déséchappés par _texte_ics, comme dans le lecteur en flux : icalendar déséchappe
+    # en plusieurs passes (une barre échappée suivie de n y devient un saut de ligne)
+    titres_bruts = _titres_bruts(donnees)
+    if len(titres_bruts) != len(cal.walk('VEVENT')): titres_bruts = None # Découpage propre à icalendar
+    n = -1 # Rang du VEVENT dans le fichier
+    for component in cal.walk():
+        if component.name == "VEVENT":
+            n += 1
+            dtstart_prop = component.get('dtstart')
+            dtend_prop = component.get('dtend')
+            if not dtstart_prop: continue
+            if titres_bruts is None:
+                titre = str(component.get('summary'))
+            else: # SUMMARY absent : même rendu que str(None)
+                titre = _texte_ics(titres_bruts[n]) if titres_bruts[n] is not None else 'None'
+
+            recurrence_id = component.get('recurrence-id')
+            if recurrence_id is not None:
+                remplacees.setdefault(str(component.get('uid')), []).append(recurrence_id.dt)
+                # Occurrence annulée : elle disparaît simplement de la série
+                if str(component.get('status', '')).upper() == 'CANCELLED': continue
+            elif component.get('rrule') is not None or component.get('rdate') is not None:
+                maitres.append((component, titre))
+                continue
+
+            debut = normaliser_date(dtstart_prop.dt, tz_paris)
+            fin = normaliser_date(dtend_prop.dt, tz_paris) if dtend_prop else None
+            evenements.append(Evenement(debut, fin, titre))
+
+    recurrences = [_lire_recurrence(c, titre, remplacees.get(str(c.get('uid')), [])) for c, titre in maitres]
+    return evenements, recurrences
+
+class IndexSalle:
+    """
+    Index d'intervalles d'une salle : événements triés par début et stockés dans des
+    tableaux d'epochs (secondes) pour des recherches par dichotomie (bisect).
+    fin_max[i] est la plus grande fin parmi les événements 0..i : cette suite croissante
+    permet de détecter un chevauchement en O(log n), même quand des cours se superposent.
+    Un événement sans DTEND est ponctuel (fin = début) : il figure au planning mais n'occupe
+    jamais la salle (absent de fin_max, ignoré par en_cours, prochain et chevauche).
+    """
+    __slots__ = ('debuts', 'fins', 'fin_max', 'titres')
+
+    def __init__(self, debuts, fins, titres, fin_max=None):
+        """
+        Construit l'index à partir de tableaux déjà triés par début (voir tableaux_evenements).
+        Les tableaux peuvent aussi être des vues sur le snapshot binaire (fin_max est alors fourni).
+        """
+        self.debuts = debuts
+        self.fins = fins
+        self.titres = titres
+        if fin_max is not None:
+            self.fin_max = fin_max
+            return
+        self.fin_max = array('q')
+        plus_grande_fin = FIN_AUCUNE
+        for debut, fin in zip(debuts, fins):
+            if fin != debut: plus_grande_fin = max(plus_grande_fin, fin)
+            self.fin_max.append(plus_grande_fin)
+
+    def __len__(self):
+        return len(self.debuts)
+
+    def evenement(self, k):
+        """Événement d'indice k sous forme (debut, fin, titre), en epochs."""
+        return (self.debuts[k], self.fins[k], self.titres[k])
+
+    def en_cours(self, t):
+        """Indice de l'événement qui contient l'instant t (début <= t <= fin), sinon None."""
+        i = bisect_right(self.debuts, t) # Événements déjà commencés : 0..i-1
+        if i == 0 or self.fin_max[i - 1] < t: return None
+        # Premier indice où fin_max atteint t : c'est forcément la fin de cet événement
+        return bisect_left(self.fin_max, t, 0, i)
+
+    def prochain(self, t):
+        """Indice du premier événement non ponctuel qui commence strictement après t, sinon None."""
+        i = bisect_right(self.debuts, t)
+        while i < len(self.debuts) and self.fins[i] == self.debuts[i]: i += 1
+        return i if i < len(self.debuts) else None
+
+    def chevauche(self, debut, fin):
+        """True si au moins un événement chevauche le créneau [debut, fin]."""
+        i = bisect_left(self.debuts, fin) # Événements qui commencent avant la fin du créneau
+        return i > 0 and self.fin_max[i - 1] > debut
+
+    def entre(self, debut, fin):
+        """Indices (chronologiques) des événements qui finissent après debut et commencent avant fin."""
+        i = bisect_left(self.debuts, fin)
+        # Avant j, tout est terminé avant 'debut' (les ponctuels, absents de fin_max, commencent après bisect_right)
+        j = min(bisect_right(self.fin_max, debut, 0, i), bisect_right(self.debuts, debut, 0, i))
+        return [k for k in range(j, i) if self.fins[k] > debut]
+
+def compiler_recurrence(recurrence):
+    """Construit le rruleset dateutil (avec cache d'occurrences) d'une série récurrente."""
+    regle = rruleset(cache=True)
+    for chaine in recurrence.rrules:
+        regle.rrule(rrulestr(chaine, dtstart=recurrence.debut))
+    if not recurrence.rrules:
+        regle.rdate(recurrence.debut) # Série RDATE seule : DTSTART est la première occurrence
+    for d in recurrence.rdates: regle.rdate(d)
+    for d in recurrence.exdates: regle.exdate(d)
+    return regle
+
+def _debut_jour(jour, tz):
+    """Epoch de minuit (fuseau tz) pour une date donnée."""
+    return tz.localize(datetime.combine(jour, datetime.min.time())).timestamp()
+
+class CalendrierSalle:
+    """
+    Calendrier complet d'une salle : index des événements simples + séries récurrentes.
+    Les occurrences des séries sont développées paresseusement, jour par jour, uniquement
+    pour les fenêtres interrogées ; les jours déjà développés restent en cache (LRU).
+    Toutes les méthodes manipulent des epochs et renvoient des tuples (debut, fin, titre).
+    """
+    __slots__ = ('index', 'recurrences', 'duree_max', '_regles', '_jours', '_verrou')
+
+    def __init__(self, index, recurrences):
+        self.index = index
+        self.recurrences = recurrences
+        self.duree_max = max((r.duree for r in recurrences), default=0)
+        self._regles = [(compiler_recurrence(r), pytz.timezone(r.fuseau), r.duree, r.titre) for r in recurrences]
+        self._jours = OrderedDict() # date -> occurrences triées qui commencent ce jour-là
+        self._verrou = threading.Lock()
+
+    def _occurrences_jour(self, jour):
+        """Occurrences des séries qui commencent le jour donné (fuseau Paris), avec mise en cache."""
+        with self._verrou:
+            occurrences = self._jours.get(jour)
+            if occurrences is not None:
+                self._jours.move_to_end(jour)
+                return occurrences
+
+        tz_paris = pytz.timezone('Europe/Paris')
+        a = _debut_jour(jour, tz_paris)
+        b = _debut_jour(jour + timedelta(days=1), tz_paris)
+        occurrences = []
+        for regle, tz, duree, titre in self._regles:
+            na = datetime.fromtimestamp(a, tz).replace(tzinfo=None)
+            nb = datetime.fromtimestamp(b, tz).replace(tzinfo=None)
+            for d in regle.between(na, nb, inc=True):
+                debut = int(tz.localize(d).timestamp())
+                if a <= debut < b:
+                    occurrences.append((debut, debut + duree, titre))
+        occurrences.sort(key=lambda o: o[0])
+
+        with self._verrou:
+            self._jours[jour] = occurrences
+            while len(self._jours) > TAILLE_MAX_JOURS_DEVELOPPES:
+                self._jours.popitem(last=False)
+        return occurrences
+
+    def _jours_couverts(self, a, b):
+        """Jours (fuseau Paris) à développer pour couvrir [a, b], bornés à l'horizon autour de maintenant."""
+        maintenant = time.time()
+        horizon = HORIZON_RECURRENCES_JOURS * 86400
+        a = max(a - self.duree_max, maintenant - horizon)
+        b = min(b, maintenant + horizon)
+        if not self._regles or a > b: return
+        tz_paris = pytz.timezone('Europe/Paris')
+        jour = datetime.fromtimestamp(a, tz_paris).date()
+        dernier = datetime.fromtimestamp(b, tz_paris).date()
+        while jour <= dernier:
+            yield jour
+            jour += timedelta(days=1)
+
+    def en_cours(self, t):
+        """Événement qui contient l'instant t (début <= t <= fin), sinon None."""
+        i = self.index.en_cours(t)
+        courant = self.index.evenement(i) if i is not None else None
+        for jour in self._jours_couverts(t, t):
+            for o in self._occurrences_jour(jour):
+                if o[0] <= t <= o[1] and o[0] < o[1] and (courant is None or o[0] < courant[0]):
+                    courant = o
+        return courant
+
+    def prochain(self, t):
+        """Premier événement qui commence strictement après t, sinon None."""
+        j = self.index.prochain(t)
+        meilleur = self.index.evenement(j) if j is not None else None
+        limite = time.time() + HORIZON_RECURRENCES_JOURS * 86400
+        for regle, tz, duree, titre in self._regles:
+            if duree == 0: continue # Série sans DTEND ni DURATION : ponctuelle
+            # after() parcourt le cache d'occurrences de la règle : pas de développement par jour ici
+            d = regle.after(datetime.fromtimestamp(t, tz).replace(tzinfo=None))
+            if d is None: continue
+            debut = int(tz.localize(d).timestamp())
+            if debut > t and debut <= limite and (meilleur is None or debut < meilleur[0]):
+                meilleur = (debut, debut + duree, titre)
+        return meilleur
+
+    def chevauche(self, debut, fin):
+        """True si au moins un événement chevauche le créneau [debut, fin]."""
+        if self.index.chevauche(debut, fin): return True
+        return any(o[0] < fin and o[1] > debut and o[0] < o[1]
+                   for jour in self._jours_couverts(debut, fin) for o in self._occurrences_jour(jour))
+
+    def occurrences(self, debut, fin):
+        """
+        Occurrences des séries qui chevauchent [debut, fin], non triées. Développe la fenêtre d'un
+        bloc, sans passer par le cache par jour : adapté aux grandes fenêtres (matrice d'occupation).
+        """
+        maintenant = time.time()
+        horizon = HORIZON_RECURRENCES_JOURS * 86400
+        a = max(debut - self.duree_max, maintenant - horizon)
+        b = min(fin, maintenant + horizon)
+        resultat = []
+        if a > b: return resultat
+        for regle, tz, duree, titre in self._regles:
+            na = datetime.fromtimestamp(a, tz).replace(tzinfo=None)
+            nb = datetime.fromtimestamp(b, tz).replace(tzinfo=None)
+            for d in regle.between(na, nb, inc=True):
+                o = int(tz.localize(d).timestamp())
+                if o < fin and o + duree > debut:
+                    resultat.append((o, o + duree, titre))
+        return resultat
+
+    def entre(self, debut, fin):
+        """Événements (ordre chronologique) qui finissent après debut et commencent avant fin."""
+        simples = [self.index.evenement(k) for k in self.index.entre(debut, fin)]
+        occurrences = [o for jour in self._jours_couverts(debut, fin) for o in self._occurrences_jour(jour)
+                       if o[1] > debut and o[0] < fin]
+        return list(heapq.merge(simples, occurrences, key=lambda e: e[0]))
+
+def tableaux_evenements(evenements):
+    """Convertit des Evenement en tableaux compacts (débuts, fins, titres) triés par début."""
+    debuts, fins, titres = array('q'), array('q'), []
+    # Tri stable : à début égal, l'ordre du fichier est conservé
+    for ev in sorted(evenements, key=lambda e: e.debut):
+        debut = int(ev.debut.timestamp())
+        debuts.append(debut)
+        fins.append(int(ev.fin.timestamp()) if ev.fin is not None else debut)
+        titres.append(ev.titre)
+    return debuts, fins, titres
+
+def extraire_calendrier(chemin):
+    """
+    Parse et normalise un fichier ICS en données compactes et picklables :
+    (débuts, fins, titres, recurrences). Utilisable dans un processus fils.
+    """
+    evenements, recurrences = lire_calendrier(chemin)
+    debuts, fins, titres = tableaux_evenements(evenements)
+    return debuts, fins, titres, recurrences
+
+def construire_calendrier(debuts, fins, titres, recurrences):
+    """Assemble le calendrier indexé à partir des données compactes."""
+    return CalendrierSalle(IndexSalle(debuts, fins, titres), recurrences)
+
+def charger_calendrier(chemin):
+    """Parse un fichier ICS et construit le calendrier indexé de la salle."""
+    return construire_calendrier(*extraire_calendrier(chemin))
+
+class CacheCalendriers:
+    """
+    Cache LRU partagé par tout le processus : chemin ICS -> calendrier indexé de la salle.
+    La clé de validité est le couple (mtime, taille) du fichier : une requête "à chaud"
+    ne fait qu'un os.stat() et ne touche jamais au parser icalendar.
+    La tâche de fond relit tous les fichiers de son dossier à chaque recalcul : elle réserve
+    leur nombre (voir reserver), sinon un campus plus grand que le cache serait re-parsé en boucle.
+    """
+    def __init__(self, taille_max, chargeur):
+        self.taille_min = taille_max # Marge hors réservations
+        self.taille_max = taille_max
+        self.chargeur = chargeur # Fonction chemin -> objet mis en cache
+        self.hits = 0
+        self.misses = 0
+        self._entrees = OrderedDict() # chemin -> (signature, valeur, erreur)
+        self._reservations = {} # dossier surveillé -> nombre de fichiers relus à chaque recalcul
+        self._verrou = threading.Lock()
+
+    def reserver(self, dossier, nombre):
+        """Agrandit (ou réduit) le cache pour garder les 'nombre' fichiers de ce dossier en plus de la marge."""
+        with self._verrou:
+            self._reservations[dossier] = nombre
+            self.taille_max = self.taille_min + sum(self._reservations.values())
+
+    def get(self, chemin):
+        """
+        Retourne le calendrier du fichier (depuis le cache si possible).
+        Lève l'exception d'origine si le fichier est illisible (l'échec est lui aussi mis en cache).
+        """
+        cle = os.path.abspath(chemin)
+        signature = self.signature(cle)
+
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] == signature:
+                self._entrees.move_to_end(cle)
+                self.hits += 1
+                valeur, erreur = entree[1], entree[2]
+                if erreur is not None: raise erreur
+                return valeur
+            self.misses += 1
+
+        # Parsing hors verrou : les autres requêtes ne sont pas bloquées pendant ce temps
+        valeur, erreur = None, None
+        try:
+            valeur = self.chargeur(cle)
+        except Exception as e:
+            erreur = e
+            METRIQUES.incrementer("salledispo_erreurs_total", (("categorie", "parsing"),))
+
+        self.inserer(cle, signature, valeur, erreur)
+        if erreur is not None: raise erreur
+        return valeur
+
+    @staticmethod
+    def signature(chemin):
+        """Clé de validité d'un fichier : (mtime, taille)."""
+        st = os.stat(chemin)
+        return (st.st_mtime_ns, st.st_size)
+
+    def est_a_jour(self, chemin):
+        """True si le fichier est en cache avec une signature identique à celle sur disque."""
+        cle = os.path.abspath(chemin)
+        try: signature = self.signature(cle)
+        except OSError: return False
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            return entree is not None and entree[0] == signature
+
+    def inserer(self, chemin, signature, valeur, erreur=None):
+        """Ajoute (ou remplace) une entrée, puis applique l'éviction LRU."""
+        cle = os.path.abspath(chemin)
+        with self._verrou:
+            self._entrees[cle] = (signature, valeur, erreur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def entree(self, chemin):
+        """(signature, valeur, erreur) actuellement en cache pour ce fichier, sans os.stat(), ou None."""
+        with self._verrou:
+            return self._entrees.get(os.path.abspath(chemin))
+
+    def stats(self):
+        """Compteurs du cache (taille actuelle, hits, misses)."""
+        with self._verrou:
+            return {"taille": len(self._entrees), "taille_max": self.taille_max,
+                    "hits": self.hits, "misses": self.misses}
+
+    def vider(self):
+        """Vide le cache (ex : après un remplacement massif des fichiers ICS)."""
+        with self._verrou:
+            self._entrees.clear()
+
+CACHE_ICS = CacheCalendriers(TAILLE_MAX_CACHE_ICS, charger_calendrier)
+
+# =========================================================
+# 🚀 CHARGEMENT EN MASSE (DÉMARRAGE À FROID)
+# =========================================================
+# Après un déploiement ou l'export nocturne, tous les fichiers sont à re-parser d'un coup.
+# Le parsing icalendar étant CPU-bound, on le répartit sur plusieurs processus : chaque fils
+# renvoie des tableaux compacts au parent, qui ne fait que construire les index.
+NB_PROCESSUS_PARSING = int(os.environ.get('SALLEDISPO_PROCESSUS', os.cpu_count() or 1))
+TIMEOUT_PARSING_FICHIER = 30   # Secondes max de parsing par fichier (un fichier piégé ne bloque pas le lot)
+SEUIL_CHARGEMENT_PARALLELE = 32 # En dessous, démarrer les processus (spawn ~1 s) coûte plus cher que parser
+INTERVALLE_SURVEILLANCE_PARSING = 0.5 # Secondes entre deux vérifications des délais de parsing
+# Un seul pool à la fois : au démarrage, chaque bâtiment lance son premier scan en même temps,
+# et N pools de NB_PROCESSUS_PARSING processus se disputeraient les mêmes cœurs
+_VERROU_PARSING = threading.Lock()
+
+def charger_en_masse(chemins, nb_processus=None, timeout=TIMEOUT_PARSING_FICHIER):
+    """
+    Parse en parallèle les fichiers absents ou périmés du cache ICS et les y insère.
+    Un fichier en erreur (ou trop long à parser) est mis en cache comme "corrompu"
+    jusqu'à sa prochaine modification. Retourne le nombre de fichiers parsés.
+    """
+    nb_processus = nb_processus or NB_PROCESSUS_PARSING
+    a_charger = []
+    for chemin in chemins:
+        if CACHE_ICS.est_a_jour(chemin): continue
+        try: a_charger.append((chemin, CACHE_ICS.signature(chemin)))
+        except OSError: pass # Fichier supprimé entre-temps
+
+    if nb_processus <= 1 or len(a_charger) < SEUIL_CHARGEMENT_PARALLELE:
+        for chemin, _ in a_charger:
+            try: CACHE_ICS.get(chemin)
+            except Exception: pass
+        return len(a_charger)
+
+    # Un fichier trop long fait arrêter tout le pool : le reste du lot repart dans un pool neuf
+    restants = a_charger
+    with _VERROU_PARSING:
+        while restants:
+            restants = _charger_lot(restants, nb_processus, timeout)
+    return len(a_charger)
+
+def _arreter_pool(pool):
+    """Tue les processus du pool (un parsing bloqué ne s'interrompt pas de lui-même), puis le libère."""
+    for processus in list((getattr(pool, '_processes', None) or {}).values()):
+        processus.terminate()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+_FILE_DEMARRAGES = None # Dans un processus fils du pool : file où signaler le début de chaque parsing
+
+def _initialiser_fils(file_demarrages):
+    global _FILE_DEMARRAGES
+    _FILE_DEMARRAGES = file_demarrages
+
+def _extraire_calendrier_signale(chemin):
+    """extraire_calendrier dans un fils du pool, après avoir signalé au parent le début du parsing."""
+    _FILE_DEMARRAGES.put(chemin)
+    return extraire_calendrier(chemin)
+
+def _charger_lot(a_charger, nb_processus, timeout):
+    """
+    Parse un lot [(chemin, signature)] dans un pool de processus et insère les résultats.
+    Le délai de chaque fichier court depuis le signal du fils qui commence à le parser
+    (une tâche "running" peut encore attendre dans la file d'appels du pool). Au premier
+    dépassement, les processus sont tués : retourne les fichiers qui restaient à parser
+    (vide si le lot est terminé).
+    """
+    # 'spawn' : pas de fork d'un processus qui contient déjà des threads (Flask, tâche de fond)
+    contexte = multiprocessing.get_context('spawn')
+    file_demarrages = contexte.Queue()
+    pool = ProcessPoolExecutor(max_workers=min(nb_processus, len(a_charger)), mp_context=contexte,
+                               initializer=_initialiser_fils, initargs=(file_demarrages,))
+    taches = {pool.submit(_extraire_calendrier_signale, chemin): (chemin, signature) for chemin, signature in a_charger}
+    demarrages = {} # chemin -> instant où le parent a reçu le signal de début du fils
+    en_attente = set(taches)
+    try:
+        while en_attente:
+            finies, en_attente = wait(en_attente, timeout=INTERVALLE_SURVEILLANCE_PARSING, return_when=FIRST_COMPLETED)
+            for tache in finies:
+                chemin, signature = taches[tache]
+                try:
+                    CACHE_ICS.inserer(chemin, signature, construire_calendrier(*tache.result()))
+                except BrokenExecutor:
+                    # Pool inutilisable (processus fils tué...) : repli sur un parsing local
+                    try: CACHE_ICS.get(chemin)
+                    except Exception: pass
+                except Exception as e:
+                    METRIQUES.incrementer("salledispo_erreurs_total", (("categorie", "parsing"),))
+                    CACHE_ICS.inserer(chemin, signature, None, e)
+
+            maintenant = time.monotonic()
+            while True:
+                try: demarrages.setdefault(file_demarrages.get_nowait(), maintenant)
+                except queue.Empty: break
+            depasses = [t for t in en_attente
+                        if taches[t][0] in demarrages and maintenant - demarrages[taches[t][0]] > timeout]
+            if depasses:
+                for tache in depasses:
+                    chemin, signature = taches[tache]
+                    journaliser_erreur("parsing_timeout", f"Parsing trop long, fichier ignoré : {chemin}")
+                    CACHE_ICS.inserer(chemin, signature, None, TimeoutError(f"Parsing de {chemin} > {timeout} s"))
+                _arreter_pool(pool)
+                return [taches[t] for t in en_attente if t not in depasses]
+        return []
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        file_demarrages.close()
+
+# =========================================================
+# 💾 SNAPSHOT BINAIRE DES CALENDRIERS (DÉMARRAGE RAPIDE)
+# =========================================================
+# Les calendriers parsés sont enregistrés dans un fichier colonnes, relu par mmap au démarrage :
+# plus aucun passage par icalendar pour les fichiers inchangés (validés par mtime + taille),
+# et les workers gunicorn partagent les mêmes pages (cache disque de l'OS) au lieu de garder
+# chacun leurs objets. Format :
+#   en-tête  : MAGIC, longueur de l'en-tête JSON (uint64), en-tête JSON (salles, colonnes), alignement 8
+#   colonnes : débuts, fins, fin_max (int64), n° de titre (uint32), puis la table des titres
+#              dédupliquée : offsets (int64, nb_titres + 1) et textes UTF-8 concaténés.
+# Les séries récurrentes (peu nombreuses) sont stockées dans l'en-tête JSON.
+MAGIC_SNAPSHOT_ICS = b"SDCAL003" # Version 3 : titres du repli icalendar déséchappés comme en flux
+_SNAPSHOTS_MAPPES = {} # chemin -> mmap du dernier snapshot chargé (les index de salles en sont des vues)
+
+class TitresMappes:
+    """Titres d'une salle lus à la demande dans la table dédupliquée du snapshot (séquence en lecture seule)."""
+    __slots__ = ('ids', 'offsets', 'textes')
+
+    def __init__(self, ids, offsets, textes):
+        self.ids = ids
+        self.offsets = offsets
+        self.textes = textes
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, k):
+        i = self.ids[k]
+        return str(self.textes[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+def _recurrence_json(r):
+    return {"debut": r.debut.isoformat(), "fuseau": r.fuseau, "duree": r.duree, "rrules": list(r.rrules),
+            "exdates": [d.isoformat() for d in r.exdates], "rdates": [d.isoformat() for d in r.rdates], "titre": r.titre}
+
+def _recurrence_depuis_json(d):
+    return Recurrence(datetime.fromisoformat(d["debut"]), d["fuseau"], d["duree"], d["rrules"],
+                      [datetime.fromisoformat(x) for x in d["exdates"]],
+                      [datetime.fromisoformat(x) for x in d["rdates"]], d["titre"])
+
+def _octets(tableau):
+    """Vue octets d'un tableau d'entiers (array ou vue sur le snapshot)."""
+    return memoryview(tableau).cast('B')
+
+def ecrire_snapshot_calendriers(chemin, entrees):
+    """
+    Écrit le snapshot binaire. 'entrees' : liste de (fichier, signature (mtime_ns, taille), calendrier).
+    Écriture dans un fichier temporaire puis os.replace : un processus qui a mappé l'ancien
+    snapshot continue à le lire sans risque.
+    """
+    debuts, fins, fin_max, ids = array('q'), array('q'), array('q'), array('I')
+    numeros = {} # titre -> n° dans la table dédupliquée
+    salles = []
+    for fichier, (mtime_ns, taille), calendrier in entrees:
+        index = calendrier.index
+        salles.append({"fichier": fichier, "mtime_ns": mtime_ns, "taille": taille, "premier": len(debuts),
+                       "nb": len(index), "recurrences": [_recurrence_json(r) for r in calendrier.recurrences]})
+        debuts.frombytes(_octets(index.debuts))
+        fins.frombytes(_octets(index.fins))
+        fin_max.frombytes(_octets(index.fin_max))
+        for k in range(len(index)):
+            ids.append(numeros.setdefault(index.titres[k], len(numeros)))
+
+    textes = [t.encode('utf-8') for t in numeros]
+    offsets = array('q', [0])
+    for t in textes: offsets.append(offsets[-1] + len(t))
+
+    colonnes, position = {}, 0
+    for nom, donnees in (("debuts", debuts), ("fins", fins), ("fin_max", fin_max), ("ids", ids), ("offsets", offsets)):
+        position += -position % 8 # Colonnes alignées sur 8 octets
+        colonnes[nom] = [position, len(donnees) * donnees.itemsize]
+        position += len(donnees) * donnees.itemsize
+    colonnes["textes"] = [position, offsets[-1]]
+    entete = json.dumps({"ordre_octets": sys.byteorder, "salles": salles, "colonnes": colonnes}).encode('utf-8')
+    entete += b" " * (-(len(MAGIC_SNAPSHOT_ICS) + 8 + len(entete)) % 8)
+
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with open(temporaire, 'wb') as f:
+        f.write(MAGIC_SNAPSHOT_ICS + struct.pack('<Q', len(entete)) + entete)
+        position = 0
+        for nom, donnees in (("debuts", debuts), ("fins", fins), ("fin_max", fin_max), ("ids", ids), ("offsets", offsets)):
+            f.write(b"\0" * (colonnes[nom][0] - position))
+            f.write(donnees.tobytes())
+            position = colonnes[nom][0] + colonnes[nom][1]
+        f.write(b"".join(textes))
+    os.replace(temporaire, chemin)
+
+def charger_snapshot_calendriers(chemin, dossier):
+    """
+    Mappe le snapshot binaire et insère dans CACHE_ICS les calendriers dont le fichier source
+    n'a pas changé (mtime + taille). Retourne le nombre de salles reprises du snapshot.
+    Un snapshot absent, d'un autre format ou corrompu est simplement ignoré (rien n'est inséré :
+    les fichiers sont re-parsés par le scan). Les colonnes et les plages de chaque salle sont
+    vérifiées ici : une vue hors limites lèverait IndexError plus tard, en pleine requête.
+    """
+    try:
+        with open(chemin, 'rb') as f:
+            carte = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return 0 # Pas de snapshot (ou fichier vide)
+
+    try:
+        if carte[:len(MAGIC_SNAPSHOT_ICS)] != MAGIC_SNAPSHOT_ICS: return 0
+        (longueur,) = struct.unpack_from('<Q', carte, len(MAGIC_SNAPSHOT_ICS))
+        debut_donnees = len(MAGIC_SNAPSHOT_ICS) + 8 + longueur
+        entete = json.loads(carte[len(MAGIC_SNAPSHOT_ICS) + 8:debut_donnees])
+        if entete["ordre_octets"] != sys.byteorder: return 0
+
+        vue = memoryview(carte)
+        def colonne(nom, format_):
+            position, taille = entete["colonnes"][nom]
+            if position < 0 or taille < 0 or debut_donnees + position + taille > len(carte):
+                raise ValueError(f"snapshot tronqué (colonne {nom})")
+            return vue[debut_donnees + position:debut_donnees + position + taille].cast(format_)
+        debuts, fins, fin_max = colonne("debuts", 'q'), colonne("fins", 'q'), colonne("fin_max", 'q')
+        ids, offsets, textes = colonne("ids", 'I'), colonne("offsets", 'q'), colonne("textes", 'B')
+
+        # Colonnes cohérentes entre elles : une ligne par événement, table des titres bornée
+        nb_evenements = len(debuts)
+        if not len(fins) == len(fin_max) == len(ids) == nb_evenements:
+            raise ValueError("colonnes d'événements de longueurs différentes")
+        tableau_offsets = np.frombuffer(offsets, dtype=np.int64)
+        if (len(tableau_offsets) == 0 or tableau_offsets[0] != 0 or tableau_offsets[-1] != len(textes)
+                or np.any(np.diff(tableau_offsets) < 0)):
+            raise ValueError("table des titres incohérente")
+        if nb_evenements and int(np.frombuffer(ids, dtype=np.uint32).max()) >= len(tableau_offsets) - 1:
+            raise ValueError("n° de titre hors de la table")
+
+        calendriers = []
+        for salle in entete["salles"]:
+            a, nb = salle["premier"], salle["nb"]
+            if not (isinstance(a, int) and isinstance(nb, int) and 0 <= a and 0 <= nb and a + nb <= nb_evenements):
+                raise ValueError(f"plage d'événements hors des colonnes : {salle['fichier']}")
+            recurrences = [_recurrence_depuis_json(r) for r in salle["recurrences"]]
+            source = os.path.join(dossier, salle["fichier"])
+            try:
+                signature = CacheCalendriers.signature(source)
+            except OSError:
+                continue # Fichier supprimé depuis
+            if signature != (salle["mtime_ns"], salle["taille"]): continue
+            b = a + nb
+            index = IndexSalle(debuts[a:b], fins[a:b], TitresMappes(ids[a:b], offsets, textes), fin_max=fin_max[a:b])
+            calendriers.append((source, signature, CalendrierSalle(index, recurrences)))
+    except (ValueError, KeyError, TypeError, struct.error) as e:
+        journaliser_erreur("snapshot_ics", f"Snapshot des calendriers illisible, ignoré : {e}")
+        return 0
+
+    # Tout est valide : insertion d'un bloc (jamais de snapshot à moitié repris)
+    for source, signature, calendrier in calendriers:
+        CACHE_ICS.inserer(source, signature, calendrier)
+    _SNAPSHOTS_MAPPES[chemin] = carte
+    return len(calendriers)
+
+def sauvegarder_snapshot_calendriers(fichiers, batiment=None):
+    """Enregistre les calendriers en cache des fichiers donnés (ceux en erreur sont re-parsés au démarrage)."""
+    batiment = batiment or BATIMENT_DEFAUT
+    if not batiment.fichier_snapshot: return
+    entrees = []
+    for f in fichiers:
+        chemin = batiment.chemin(f)
+        entree = CACHE_ICS.entree(chemin)
+        if entree is None:
+            # Évincé du cache depuis le scan : relu plutôt qu'absent du snapshot
+            try: CACHE_ICS.get(chemin)
+            except Exception: continue
+            entree = CACHE_ICS.entree(chemin)
+        if entree is not None and entree[1] is not None:
+            entrees.append((f, entree[0], entree[1]))
+    try:
+        ecrire_snapshot_calendriers(batiment.fichier_snapshot, entrees)
+    except OSError as e:
+        journaliser_erreur("snapshot_ics", f"Erreur écriture snapshot des calendriers : {e}")
+
 # =========================================================
 # 🧠 CŒUR DU SYSTÈME : ANALYSE DES ICS (LOGIQUE MÉTIER)
 # =========================================================
 
-def verifier_dispo_creneau(nom_fichier, start_req, end_req):
+@mesure("verifier_dispo_creneau")
+def verifier_dispo_creneau(nom_fichier, start_req, end_req, batiment=None):
     """
     Vérifie si une salle est libre sur un créneau spécifique (pour les filtres).
     Retourne True si libre, False si occupée.
     """
-    chemin = os.path.join(DOSSIER_CIBLE, nom_fichier)
+    chemin = (batiment or BATIMENT_DEFAUT).chemin(nom_fichier)
     try:
-        with open(chemin, 'rb') as f: cal = Calendar.from_ical(f.read())
+        calendrier = CACHE_ICS.get(chemin)
         tz_paris = pytz.timezone('Europe/Paris')
         
         # Localisation des dates requises pour comparaison timezone-aware
         if start_req.tzinfo is None: start_req = tz_paris.localize(start_req)
         if end_req.tzinfo is None: end_req = tz_paris.localize(end_req)
 
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                dtstart_prop = component.get('dtstart')
-                dtend_prop = component.get('dtend')
-                if not dtstart_prop or not dtend_prop: continue
-                
-                dtstart = dtstart_prop.dt
-                dtend = dtend_prop.dt
-
-                # Normalisation des types de dates (Date vs DateTime)
-                if not isinstance(dtstart, datetime):
-                    dtstart = datetime.combine(dtstart, datetime.min.time())
-                    dtend = datetime.combine(dtend, datetime.min.time())
-                    dtstart = tz_paris.localize(dtstart)
-                    dtend = tz_paris.localize(dtend)
-                else:
-                    if not hasattr(dtstart, 'tzinfo') or dtstart.tzinfo is None:
-                        dtstart = tz_paris.localize(dtstart)
-                        dtend = tz_paris.localize(dtend)
-                    else:
-                        dtstart = dtstart.astimezone(tz_paris)
-                        dtend = dtend.astimezone(tz_paris)
-                
-                # Vérification de chevauchement de créneaux
-                if dtstart < end_req and dtend > start_req:
-                    return False
-        return True
+        # Vérification de chevauchement de créneaux (recherche dichotomique)
+        return not calendrier.chevauche(start_req.timestamp(), end_req.timestamp())
     except: return False
 
-def get_salle_status(nom_fichier):
+@mesure("get_salle_status")
+def get_salle_status(nom_fichier, batiment=None):
     """
     Analyse le fichier ICS pour déterminer l'état actuel de la salle :
     - OCCUPÉ (avec progression)
     - LIBRE (avec indication du prochain cours)
     - ERREUR (si fichier corrompu)
     """
-    chemin_complet = os.path.join(DOSSIER_CIBLE, nom_fichier)
+    chemin_complet = (batiment or BATIMENT_DEFAUT).chemin(nom_fichier)
     if not os.path.exists(chemin_complet):
         return {"etat": "ERREUR", "color": "secondary", "msg": "Introuvable", "sub_msg": "", "progression": 0}
 
     try:
-        with open(chemin_complet, 'rb') as f: 
-            cal = Calendar.from_ical(f.read())
+        calendrier = CACHE_ICS.get(chemin_complet)
             
         # Utilisation stricte du fuseau Paris pour éviter les décalages UTC
         tz_paris = pytz.timezone('Europe/Paris')
         maintenant = datetime.now(tz_paris)
-        
-        prochain_cours = None
-        delta_min = float('inf')
-        cours_trouve = False
-        
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                dtstart_prop = component.get('dtstart')
-                dtend_prop = component.get('dtend')
-                if not dtstart_prop or not dtend_prop: continue
-                
-                dtstart = dtstart_prop.dt
-                dtend = dtend_prop.dt
-                summary = str(component.get('summary')).replace('\\,', ',')
-
-                # --- FIX COMPATIBILITÉ GOOGLE CALENDAR ---
-                # Convertit les événements "Journée entière" (Date) en DateTime (Minuit)
-                # pour permettre la comparaison avec "maintenant".
-                if not isinstance(dtstart, datetime):
-                    dtstart = datetime.combine(dtstart, datetime.min.time())
-                    dtend = datetime.combine(dtend, datetime.min.time())
-                    dtstart = tz_paris.localize(dtstart)
-                    dtend = tz_paris.localize(dtend)
-                else:
-                    if not hasattr(dtstart, 'tzinfo') or dtstart.tzinfo is None:
-                        dtstart = tz_paris.localize(dtstart)
-                        dtend = tz_paris.localize(dtend)
-                    else:
-                        dtstart = dtstart.astimezone(tz_paris)
-                        dtend = dtend.astimezone(tz_paris)
-                # ---------------------------------------
-
-                # 1. CAS OCCUPÉ : L'heure actuelle est dans le créneau
-                if dtstart <= maintenant <= dtend:
-                    fin_txt = dtend.strftime("%H:%M")
-                    # Calcul du % de progression pour la barre visuelle
-                    total = (dtend - dtstart).total_seconds()
-                    ecoule = (maintenant - dtstart).total_seconds()
-                    prog = int((ecoule/total)*100) if total > 0 else 100
-                    return {"etat": "OCCUPÉ", "color": "danger", "msg": summary, "sub_msg": f"Fin à {fin_txt}", "progression": prog}
-
-                # 2. CAS PROCHAIN COURS : On cherche le cours futur le plus proche
-                if dtstart > maintenant:
-                    cours_trouve = True
-                    delta = (dtstart - maintenant).total_seconds()
-                    if delta < delta_min:
-                        delta_min = delta
-                        debut_txt = dtstart.strftime("%H:%M")
-                        if len(summary) > 30: summary = summary[:30] + "..."
-                        prochain_cours = f"{debut_txt} : {summary}"
-
-        # 3. RETOUR DE L'ÉTAT LIBRE
-        if prochain_cours:
+        t = maintenant.timestamp()
+
+        # 1. CAS OCCUPÉ : L'heure actuelle est dans un créneau
+        cours = calendrier.en_cours(t)
+        if cours is not None:
+            dtstart = datetime.fromtimestamp(cours[0], tz_paris)
+            dtend = datetime.fromtimestamp(cours[1], tz_paris)
+            fin_txt = dtend.strftime("%H:%M")
+            # Calcul du % de progression pour la barre visuelle
+            total = (dtend - dtstart).total_seconds()
+            ecoule = (maintenant - dtstart).total_seconds()
+            prog = int((ecoule/total)*100) if total > 0 else 100
+            return {"etat": "OCCUPÉ", "color": "danger", "msg": cours[2], "sub_msg": f"Fin à {fin_txt}", "progression": prog}
+
+        # 2. CAS PROCHAIN COURS : Premier cours qui commence après maintenant
+        prochain = calendrier.prochain(t)
+        if prochain is not None:
+            debut_txt = datetime.fromtimestamp(prochain[0], tz_paris).strftime("%H:%M")
+            summary = prochain[2]
+            if len(summary) > 30: summary = summary[:30] + "..."
+            prochain_cours = f"{debut_txt} : {summary}"
             return {"etat": "LIBRE", "color": "success", "msg": "Libre", "sub_msg": f"Prochain : {prochain_cours}", "progression": 0}
-        elif cours_trouve:
-            return {"etat": "LIBRE", "color": "success", "msg": "Libre", "sub_msg": "Plus de cours auj.", "progression": 0}
-        else:
-            return {"etat": "LIBRE", "color": "success", "msg": "Libre", "sub_msg": "Planning vide", "progression": 0}
+
+        # 3. RETOUR DE L'ÉTAT LIBRE (aucun cours à venir)
+        return {"etat": "LIBRE", "color": "success", "msg": "Libre", "sub_msg": "Planning vide", "progression": 0}
 
     except Exception as e:
-        print(f"❌ Erreur lecture {nom_fichier} : {e}")
+        journaliser_erreur("statut", f"Erreur lecture {nom_fichier} : {e}")
         return {"etat": "ERREUR", "color": "warning", "msg": "Erreur", "sub_msg": "Fichier corrompu", "progression": 0}
 
-def get_planning_etendu(nom_fichier):
+# =========================================================
+# 📅 PLANNING DÉTAILLÉ PAR SALLE
+# =========================================================
+# Le planning formaté (dates en toutes lettres, horaires, titres) est découpé par jour et gardé
+# en cache pour chaque salle : parcourir le semestre d'une salle, semaine après semaine, ne
+# redéveloppe ni ne reformate les jours déjà vus. Une entrée est indexée par la signature
+# (mtime, taille) du fichier : s'il change, les jours concernés sont recalculés.
+# Aujourd'hui et demain sont préparés dès le scan.
+JOURS_PLANNING_DETAIL = 15        # Jours entiers de la page détail (chargés avec la page, aujourd'hui compris)
+JOURS_PRECHAUFFES_PLANNING = 2    # Jours préparés au scan (aujourd'hui, demain) : 2 entrées par salle, le reste pour les visites
+JOURS_MAX_PAGE_PLANNING = 31      # Jours maximum par page de l'API planning
+JOURS_MAX_PLANNING = 366          # Distance maximale (passé ou futur) d'une page par rapport à aujourd'hui
+CACHE_PLANNING = CacheLRU(8192)   # (chemin, signature du fichier, jour) -> [(fin, evenement formaté)]
+
+# Noms fixes : strftime("%A %B") suit la locale du processus (anglais sous gunicorn ou en locale C)
+NOMS_JOURS = ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche")
+NOMS_MOIS = ("janvier", "février", "mars", "avril", "mai", "juin",
+             "juillet", "août", "septembre", "octobre", "novembre", "décembre")
+
+def jour_en_lettres(jour):
+    """Date affichée au planning : 'Lundi 06 janvier'."""
+    return f"{NOMS_JOURS[jour.weekday()]} {jour.day:02d} {NOMS_MOIS[jour.month - 1]}".capitalize()
+
+def planning_jour(chemin_complet, jour):
+    """
+    Cours qui commencent le jour donné dans une salle, formatés et triés par heure de début.
+    Retourne une liste de tuples (fin epoch, dictionnaire) ; lève une exception si le fichier est illisible.
+    """
+    # La signature (mtime, taille) suffit à invalider : l'entrée ne retient pas le calendrier,
+    # qui peut être libéré dès que CACHE_ICS le remplace
+    cle = (chemin_complet, CacheCalendriers.signature(chemin_complet), jour)
+    evenements = CACHE_PLANNING.get(cle)
+    if evenements is not None:
+        return evenements
+
+    calendrier = CACHE_ICS.get(chemin_complet)
+
+    tz_paris = pytz.timezone('Europe/Paris')
+    debut_jour = _debut_jour(jour, tz_paris)
+    fin_jour = _debut_jour(jour + timedelta(days=1), tz_paris)
+    date_iso = jour.isoformat()
+    jour_joli = jour_en_lettres(jour)
+    evenements = []
+    for debut_ev, fin_ev, titre in calendrier.entre(debut_jour, fin_jour):
+        if debut_ev < debut_jour: continue # Cours commencé la veille : rangé sous son propre jour
+        evenements.append((fin_ev, cours_planning(debut_ev, fin_ev, titre, date_iso, jour_joli)))
+    CACHE_PLANNING.set(cle, evenements)
+    return evenements
+
+def cours_planning(debut_ev, fin_ev, titre, date_iso, jour_joli):
+    """Cours formaté pour la page détail, rangé sous le jour de son début."""
+    tz_paris = pytz.timezone('Europe/Paris')
+    dtstart = datetime.fromtimestamp(debut_ev, tz_paris)
+    dtend = datetime.fromtimestamp(fin_ev, tz_paris)
+    return {
+        "date_iso": date_iso,
+        "jour_joli": jour_joli,
+        "horaire": f"{dtstart.strftime('%H:%M')} - {dtend.strftime('%H:%M')}",
+        "titre": titre,
+        "timestamp": dtstart.timestamp()
+    }
+
+def prechauffer_plannings(fichiers, batiment=None):
+    """Prépare le planning des prochains jours des salles dont le fichier vient de changer."""
+    batiment = batiment or BATIMENT_DEFAUT
+    aujourd_hui = datetime.now(pytz.timezone('Europe/Paris')).date()
+    for f in fichiers:
+        chemin_complet = batiment.chemin(f)
+        try:
+            for i in range(JOURS_PRECHAUFFES_PLANNING):
+                planning_jour(chemin_complet, aujourd_hui + timedelta(days=i))
+        except Exception:
+            pass # Fichier corrompu : l'erreur remontera dans son statut
+
+@mesure("get_planning_etendu")
+def get_planning_etendu(nom_fichier, batiment=None):
     """
-    Récupère la liste des événements des 15 prochains jours pour l'affichage détaillé.
+    Récupère la liste des événements non terminés des 15 prochains jours (jours entiers, aujourd'hui
+    compris) pour l'affichage détaillé. Les jours suivants viennent de l'API planning, à partir du
+    lendemain du dernier jour (voir detail) : aucun cours n'est envoyé deux fois.
     Retourne une liste de dictionnaires triés par date.
     """
-    chemin_complet = os.path.join(DOSSIER_CIBLE, nom_fichier)
+    chemin_complet = (batiment or BATIMENT_DEFAUT).chemin(nom_fichier)
     liste_evenements = []
     try:
-        with open(chemin_complet, 'rb') as f: 
-            cal = Calendar.from_ical(f.read())
-            
         tz_paris = pytz.timezone('Europe/Paris')
         maintenant = datetime.now(tz_paris)
-        fin = maintenant + timedelta(days=15)
-        
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                # ... (Logique identique de parsing et conversion de dates) ...
-                dtstart_prop = component.get('dtstart')
-                dtend_prop = component.get('dtend')
-                if not dtstart_prop: continue
-                
-                dtstart = dtstart_prop.dt
-                # Gestion de la fin d'événement (parfois manquante)
-                if dtend_prop: dtend = dtend_prop.dt
-                else: dtend = dtstart
-                
-                summary = str(component.get('summary')).replace('\\,', ',')
-
-                if not isinstance(dtstart, datetime):
-                    dtstart = datetime.combine(dtstart, datetime.min.time())
-                    if not isinstance(dtend, datetime):
-                        dtend = datetime.combine(dtend, datetime.min.time())
-                    dtstart = tz_paris.localize(dtstart)
-                    dtend = tz_paris.localize(dtend)
-                else:
-                    if not hasattr(dtstart, 'tzinfo') or dtstart.tzinfo is None:
-                        dtstart = tz_paris.localize(dtstart)
-                        dtend = tz_paris.localize(dtend)
-                    else:
-                        dtstart = dtstart.astimezone(tz_paris)
-                        dtend = dtend.astimezone(tz_paris)
-
-                # Filtre : Seulement les événements futurs sur 15 jours
-                if dtend > maintenant and dtstart < fin:
-                    liste_evenements.append({
-                        "date_iso": dtstart.strftime("%Y-%m-%d"),
-                        "jour_joli": dtstart.strftime("%A %d %B").capitalize(),
-                        "horaire": f"{dtstart.strftime('%H:%M')} - {dtend.strftime('%H:%M')}",
-                        "titre": summary,
-                        "timestamp": dtstart.timestamp()
-                    })
-        # Tri chronologique important pour l'affichage
-        liste_evenements.sort(key=lambda x: x['timestamp'])
+        t = maintenant.timestamp()
+        veille = maintenant.date() - timedelta(days=1)
+
+        # Cours commencés avant la veille et toujours en cours (examens, stages sur plusieurs jours)
+        debut_veille = _debut_jour(veille, tz_paris)
+        for debut_ev, fin_ev, titre in CACHE_ICS.get(chemin_complet).entre(t, t):
+            if debut_ev < debut_veille:
+                jour = datetime.fromtimestamp(debut_ev, tz_paris).date()
+                liste_evenements.append(cours_planning(debut_ev, fin_ev, titre, jour.isoformat(), jour_en_lettres(jour)))
+
+        # Filtre : Seulement les événements non terminés (la veille pour un cours de nuit en cours)
+        for i in range(-1, JOURS_PLANNING_DETAIL):
+            for fin_ev, evenement in planning_jour(chemin_complet, maintenant.date() + timedelta(days=i)):
+                if fin_ev > t:
+                    liste_evenements.append(evenement)
         return liste_evenements
     except Exception as e:
-        print(f"❌ Erreur planning {nom_fichier} : {e}")
+        journaliser_erreur("planning", f"Erreur planning {nom_fichier} : {e}")
         return []
 
+def prochaine_bascule(nom_fichier, t, batiment=None):
+    """
+    Instant (epoch) du prochain changement d'état de la salle après t :
+    fin du cours en cours, ou début du prochain cours. None si rien de prévu.
+    """
+    try:
+        calendrier = CACHE_ICS.get((batiment or BATIMENT_DEFAUT).chemin(nom_fichier))
+    except Exception:
+        return None
+    cours = calendrier.en_cours(t)
+    if cours is not None: return cours[1]
+    prochain = calendrier.prochain(t)
+    return prochain[0] if prochain is not None else None
+
+# =========================================================
+# 🔄 TÂCHE DE FOND : SNAPSHOT DES STATUTS
+# =========================================================
+# Les statuts de toutes les salles sont recalculés par un thread de fond, et non plus
+# dans chaque requête : index() et tv_mode() se contentent de filtrer le dernier snapshot.
+# Le dossier est surveillé par scan des mtimes (pas de dépendance inotify).
+# Un service par bâtiment : une modification dans un bâtiment ne recalcule que celui-ci.
+INTERVALLE_SNAPSHOT = 30     # Secondes max entre deux recalculs complets (barres de progression)
+INTERVALLE_SURVEILLANCE = 5  # Secondes entre deux scans du dossier ICS
+
+# Photo de l'état du campus : 'version' n'augmente que si au moins un statut a changé,
+# 'versions' donne pour chaque salle la version du snapshot où son statut a changé en dernier.
+# Une version est l'horodatage (ms) du changement : elle reste croissante après un redémarrage
+# et reste comparable d'un processus gunicorn à l'autre.
+Snapshot = namedtuple('Snapshot', ['version', 'horodatage', 'fichiers', 'statuts', 'versions'])
+
+class ServiceStatuts:
+    """
+    Thread de fond qui surveille le dossier ICS d'un bâtiment et maintient le snapshot des statuts.
+    Recalcul : à chaque modification de fichier, toutes les INTERVALLE_SNAPSHOT secondes,
+    et juste après chaque début/fin de cours (prochaine "bascule" connue).
+    """
+    def __init__(self, batiment, intervalle=INTERVALLE_SNAPSHOT, intervalle_scan=INTERVALLE_SURVEILLANCE):
+        self.batiment = batiment
+        self.intervalle = intervalle
+        self.intervalle_scan = intervalle_scan
+        self.snapshot = None
+        self._signatures = {} # fichier -> (mtime, taille)
+        self.generation = 0   # Incrémenté à chaque changement du dossier ICS (invalide les caches dérivés)
+        self._snapshot_ics_lu = False
+        self._bascule = None
+        self._thread = None
+        self._abonnes = [] # Fonctions (precedent, snapshot) appelées à chaque nouveau snapshot
+        self._verrou = threading.Lock()
+        self._verrou_calcul = threading.Lock() # Un seul scan + recalcul à la fois (thread de fond ou 1er appel)
+
+    def abonner(self, callback):
+        """Enregistre une fonction appelée (dans le thread de fond) après chaque recalcul."""
+        self._abonnes.append(callback)
+
+    def scanner(self):
+        """
+        Relève (mtime, taille) de chaque .ics et re-parse uniquement les fichiers modifiés.
+        Retourne True si le contenu du dossier a changé depuis le dernier scan.
+        """
+        batiment = self.batiment
+        signatures = {}
+        if os.path.isdir(batiment.dossier):
+            with os.scandir(batiment.dossier) as entrees:
+                for entree in entrees:
+                    if entree.name.lower().endswith('.ics'):
+                        st = entree.stat()
+                        signatures[entree.name] = (st.st_mtime_ns, st.st_size)
+
+        modifies = [f for f, sig in signatures.items() if self._signatures.get(f) != sig]
+        change = bool(modifies) or signatures.keys() != self._signatures.keys()
+        self._signatures = signatures
+        CACHE_ICS.reserver(os.path.abspath(batiment.dossier), len(signatures))
+        if not self._snapshot_ics_lu and batiment.fichier_snapshot:
+            # Démarrage : les fichiers inchangés sont repris du snapshot binaire, sans parsing
+            self._snapshot_ics_lu = True
+            charger_snapshot_calendriers(batiment.fichier_snapshot, batiment.dossier)
+        # Fichier corrompu : l'erreur est mise en cache et remontera dans son statut
+        parses = charger_en_masse([batiment.chemin(f) for f in modifies])
+        prechauffer_plannings(modifies, batiment)
+        if change: self.generation += 1
+        if parses or (change and self.generation > 1):
+            sauvegarder_snapshot_calendriers(sorted(signatures), batiment)
+        return change
+
+    def recalculer(self):
+        """Recalcule le statut de toutes les salles et publie un nouveau snapshot."""
+        maintenant = time.time()
+        fichiers = sorted(self._signatures)
+        statuts = {f: get_salle_status(f, self.batiment) for f in fichiers}
+        bascules = [b for b in (prochaine_bascule(f, maintenant, self.batiment) for f in fichiers) if b is not None]
+
+        with self._verrou:
+            precedent = self.snapshot
+            version = precedent.version if precedent is not None else 0
+            if precedent is None or precedent.statuts != statuts or precedent.fichiers != fichiers:
+                version = max(version + 1, int(maintenant * 1000))
+            versions = {}
+            for f in fichiers:
+                if precedent is not None and f in precedent.statuts and precedent.statuts[f] == statuts[f]:
+                    versions[f] = precedent.versions[f]
+                else:
+                    versions[f] = version
+            self.snapshot = Snapshot(version, maintenant, fichiers, statuts, versions)
+            self._bascule = min(bascules, default=None)
+            snapshot = self.snapshot
+
+        for callback in self._abonnes:
+            try: callback(precedent, snapshot)
+            except Exception as e: journaliser_erreur("abonne_snapshot", f"Erreur abonné snapshot : {e}")
+        return snapshot
+
+    def _boucle(self):
+        """Boucle du thread : scan régulier, recalcul périodique ou sur événement."""
+        prochain_calcul = time.time() + self.intervalle
+        while True:
+            attente = self.intervalle_scan
+            if self._bascule is not None:
+                # +1 s : à la seconde exacte de fin, le cours est encore considéré "en cours"
+                attente = min(attente, self._bascule + 1 - time.time())
+            time.sleep(max(attente, 0.5))
+            try:
+                with self._verrou_calcul:
+                    change = self.scanner()
+                    maintenant = time.time()
+                    bascule_passee = self._bascule is not None and maintenant > self._bascule
+                    if change or bascule_passee or maintenant >= prochain_calcul:
+                        self.recalculer()
+                        prochain_calcul = time.time() + self.intervalle
+            except Exception as e:
+                journaliser_erreur("tache_de_fond", f"Erreur tâche de fond : {e}")
+
+    def demarrer(self):
+        """Lance le thread de fond (une seule fois par processus)."""
+        with self._verrou:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._boucle, name=f"salledispo-statuts-{self.batiment.id}", daemon=True)
+            self._thread.start()
+
+    def obtenir(self):
+        """Dernier snapshot publié. Le tout premier est calculé de façon synchrone (une seule fois)."""
+        self.demarrer()
+        if self.snapshot is None:
+            with self._verrou_calcul:
+                if self.snapshot is None: # Les requêtes concurrentes attendent le premier calcul
+                    self.scanner()
+                    self.recalculer()
+        return self.snapshot
+
+# =========================================================
+# 🌐 SYNCHRONISATION DES FLUX ICS DISTANTS
+# =========================================================
+# En production, les emplois du temps viennent des URL ICS par salle du serveur de planning
+# (ADE, Hyperplanning...). Un thread de fond les télécharge à chaque cycle, en parallèle, via
+# des connexions persistantes et des GET conditionnels (ETag / If-Modified-Since) : un flux
+# inchangé (304) ne réécrit pas son fichier, donc n'est pas re-parsé.
+# flux.json : {"intervalle_secondes": 300, "connexions_max": 8, "salles": {"103": "https://..."}}
+INTERVALLE_FLUX = 300          # Secondes entre deux cycles (si flux.json ne le précise pas)
+CONNEXIONS_MAX_FLUX = 8        # Téléchargements simultanés
+TIMEOUT_FLUX = 20              # Secondes max par requête
+TAILLE_MAX_FLUX = 64 * 1024 * 1024
+BACKOFF_MAX_FLUX = 3600        # Attente max entre deux essais d'un flux en erreur
+REDIRECTIONS_MAX_FLUX = 3
+NOM_SALLE_VALIDE = re.compile(r'^[\w.\- ]+$')
+
+def decompresser_gzip(corps, taille_max):
+    """Décompresse un corps gzip (plusieurs membres possibles) sans jamais dépasser taille_max octets (bombe gzip)."""
+    resultat = bytearray()
+    while corps:
+        decompresseur = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        resultat += decompresseur.decompress(corps, taille_max + 1 - len(resultat))
+        if len(resultat) > taille_max: raise ValueError("Flux décompressé trop volumineux")
+        if not decompresseur.eof: raise ValueError("Flux gzip tronqué")
+        corps = decompresseur.unused_data
+    return bytes(resultat)
+
+class ErreurFlux(Exception):
+    """Réponse HTTP inattendue d'un flux. 'attente' : délai demandé par le serveur (Retry-After), en secondes."""
+    def __init__(self, message, attente=None):
+        super().__init__(message)
+        self.attente = attente
+
+class PoolHTTP:
+    """Connexions HTTP(S) persistantes (keep-alive), réutilisées d'un cycle à l'autre, par hôte."""
+    def __init__(self, par_hote, timeout):
+        self.par_hote = par_hote
+        self.timeout = timeout
+        self._libres = {} # (schéma, hôte, port) -> connexions inactives
+        self._verrou = threading.Lock()
+        self._contexte_ssl = ssl.create_default_context()
+
+    def _prendre(self, cle):
+        with self._verrou:
+            libres = self._libres.get(cle)
+            if libres: return libres.pop(), True
+        schema, hote, port = cle
+        if schema == 'https':
+            return http.client.HTTPSConnection(hote, port, timeout=self.timeout, context=self._contexte_ssl), False
+        return http.client.HTTPConnection(hote, port, timeout=self.timeout), False
+
+    def _rendre(self, cle, connexion):
+        with self._verrou:
+            libres = self._libres.setdefault(cle, [])
+            if len(libres) < self.par_hote:
+                libres.append(connexion)
+                return
+        connexion.close()
+
+    def get(self, url, entetes):
+        """GET : retourne (statut, en-têtes en minuscules, corps). Lève OSError / http.client.HTTPException."""
+        morceaux = urlsplit(url)
+        if morceaux.scheme not in ('http', 'https') or not morceaux.hostname:
+            raise ValueError(f"URL non gérée : {url}")
+        cle = (morceaux.scheme, morceaux.hostname, morceaux.port)
+        chemin = (morceaux.path or '/') + (f"?{morceaux.query}" if morceaux.query else "")
+        while True:
+            connexion, reutilisee = self._prendre(cle)
+            try:
+                connexion.request('GET', chemin, headers=entetes)
+                reponse = connexion.getresponse()
+                corps = reponse.read(TAILLE_MAX_FLUX + 1)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connexion.close()
+                if reutilisee: continue # Keep-alive fermé côté serveur entre deux cycles : nouvelle connexion
+                raise
+            except Exception:
+                connexion.close()
+                raise
+            if len(corps) > TAILLE_MAX_FLUX:
+                connexion.close()
+                raise ValueError(f"Flux trop volumineux : {url}")
+            if reponse.will_close: connexion.close()
+            else: self._rendre(cle, connexion)
+            return reponse.status, {k.lower(): v for k, v in reponse.getheaders()}, corps
+
+class SynchroFlux:
+    """
+    Thread de fond qui synchronise les flux ICS listés dans flux.json vers le dossier ICS d'un bâtiment.
+    Écriture atomique (fichier temporaire + os.replace) : la tâche de fond ne lit jamais un
+    fichier à moitié écrit. Un flux en erreur est ré-essayé avec un délai exponentiel.
+    """
+    def __init__(self, chemin_config, dossier, id_batiment=None):
+        self.chemin_config = chemin_config
+        self.dossier = dossier
+        self.id_batiment = id_batiment # Nom du thread (un thread de synchro par bâtiment)
+        self._etats = {} # nom -> {url, etag, modifie, echecs, prochain_essai}
+        self._pool = PoolHTTP(CONNEXIONS_MAX_FLUX, TIMEOUT_FLUX)
+        self._thread = None
+        self._fichier_verrou = None
+        self._verrou = threading.Lock()
+
+    def lire_config(self):
+        """(intervalle, connexions_max, {nom: url}) depuis flux.json, ou None si absent/invalide."""
+        if not self.chemin_config or not os.path.exists(self.chemin_config): return None
+        try:
+            with open(self.chemin_config, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            salles = {nom: url for nom, url in data.get("salles", {}).items() if not nom.startswith('_')}
+        except Exception as e:
+            journaliser_erreur("flux", f"Erreur lecture {self.chemin_config} : {e}")
+            return None
+        for nom in [n for n in salles if not NOM_SALLE_VALIDE.match(n)]:
+            journaliser_erreur("flux", f"Nom de salle invalide dans {self.chemin_config} : {nom!r}")
+            del salles[nom]
+        intervalle = self._nombre(data, "intervalle_secondes", INTERVALLE_FLUX, float)
+        connexions_max = self._nombre(data, "connexions_max", CONNEXIONS_MAX_FLUX, int)
+        return (intervalle, connexions_max, salles)
+
+    def _nombre(self, data, cle, defaut, type_):
+        """Réglage numérique strictement positif de flux.json ; valeur par défaut (et erreur journalisée) sinon."""
+        valeur = data.get(cle, defaut)
+        try:
+            if isinstance(valeur, bool) or type_(valeur) <= 0: raise ValueError
+            return type_(valeur)
+        except (TypeError, ValueError):
+            journaliser_erreur("flux", f"{cle} invalide dans {self.chemin_config} : {valeur!r}, {defaut} utilisé")
+            return defaut
+
+    def _telecharger(self, nom, etat, intervalle):
+        """Télécharge un flux et met à jour son fichier. Retourne 'modifie', 'inchange' ou 'erreur'."""
+        entetes = {"User-Agent": "SalleDispo", "Accept-Encoding": "gzip"}
+        if etat.get("etag"): entetes["If-None-Match"] = etat["etag"]
+        if etat.get("modifie"): entetes["If-Modified-Since"] = etat["modifie"]
+        try:
+            url = etat["url"]
+            for _ in range(REDIRECTIONS_MAX_FLUX + 1):
+                statut, reponse, corps = self._pool.get(url, entetes)
+                if statut not in (301, 302, 303, 307, 308) or "location" not in reponse: break
+                url = urljoin(url, reponse["location"])
+            if statut == 304:
+                resultat = "inchange"
+            elif statut == 200:
+                if reponse.get("content-encoding") == "gzip": corps = decompresser_gzip(corps, TAILLE_MAX_FLUX)
+                resultat = "modifie" if self._ecrire(nom, corps) else "inchange"
+                etat["etag"] = reponse.get("etag")
+                etat["modifie"] = reponse.get("last-modified")
+            else:
+                attente = reponse.get("retry-after", "")
+                raise ErreurFlux(f"HTTP {statut}", int(attente) if attente.isdigit() else None)
+        except Exception as e:
+            etat["echecs"] += 1
+            attente = min(intervalle * 2 ** (etat["echecs"] - 1), BACKOFF_MAX_FLUX) * random.uniform(0.8, 1.2)
+            if isinstance(e, ErreurFlux) and e.attente is not None:
+                attente = max(attente, e.attente) # Retry-After du serveur (429 / 503)
+            etat["prochain_essai"] = time.time() + attente
+            journaliser_erreur("flux", f"Flux {nom} en erreur ({e}), nouvel essai dans {int(attente)} s")
+            return "erreur"
+        etat["echecs"] = 0
+        etat["prochain_essai"] = 0
+        return resultat
+
+    def _ecrire(self, nom, corps):
+        """Remplace atomiquement <dossier>/<nom>.ics si le contenu a changé. Retourne True si écrit."""
+        chemin = os.path.join(self.dossier, f"{nom}.ics")
+        try:
+            with open(chemin, 'rb') as f:
+                if f.read() == corps: return False # Serveur sans ETag : même contenu, pas de re-parsing
+        except OSError:
+            pass
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = os.path.join(self.dossier, f".{nom}.ics.{os.getpid()}.tmp")
+        with open(temporaire, 'wb') as f:
+            f.write(corps)
+        os.replace(temporaire, chemin)
+        return True
+
+    def synchroniser(self):
+        """Un cycle : télécharge en parallèle les flux dus. Retourne le nombre de flux par résultat."""
+        config = self.lire_config()
+        bilan = {"modifie": 0, "inchange": 0, "erreur": 0, "reporte": 0}
+        if config is None: return bilan
+        intervalle, connexions_max, salles = config
+        self._pool.par_hote = connexions_max # Autant de connexions gardées ouvertes que de téléchargements simultanés
+
+        maintenant = time.time()
+        a_traiter = []
+        with self._verrou:
+            for nom in list(self._etats):
+                if nom not in salles: del self._etats[nom]
+            for nom, url in salles.items():
+                etat = self._etats.get(nom)
+                if etat is None or etat["url"] != url:
+                    etat = self._etats[nom] = {"url": url, "etag": None, "modifie": None, "echecs": 0, "prochain_essai": 0}
+                if etat["prochain_essai"] > maintenant:
+                    bilan["reporte"] += 1 # En attente après une erreur
+                else:
+                    a_traiter.append((nom, etat))
+
+        with ThreadPoolExecutor(max_workers=connexions_max, thread_name_prefix="salledispo-flux") as pool:
+            for resultat in pool.map(lambda t: self._telecharger(t[0], t[1], intervalle), a_traiter):
+                bilan[resultat] += 1
+        for resultat, nombre in bilan.items():
+            if nombre: METRIQUES.incrementer("salledispo_flux_total", (("resultat", resultat),), nombre)
+        return bilan
+
+    def _boucle(self, intervalle):
+        while True:
+            try:
+                self.synchroniser()
+                config = self.lire_config()
+                if config is not None: intervalle = config[0]
+            except Exception as e:
+                journaliser_erreur("flux", f"Erreur synchronisation des flux : {e}")
+            time.sleep(intervalle)
+
+    def demarrer(self):
+        """Lance le thread si flux.json existe. Sous gunicorn, seul le premier worker à prendre le verrou synchronise."""
+        with self._verrou:
+            if self._thread is not None: return
+            self._thread = False # Tentative unique par processus
+            config = self.lire_config()
+            if config is None: return
+            if fcntl is not None:
+                try:
+                    self._fichier_verrou = open(f"{self.chemin_config}.lock", 'w')
+                    fcntl.flock(self._fichier_verrou, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return # Un autre processus s'en charge
+            nom = f"salledispo-synchro-{self.id_batiment}" if self.id_batiment else "salledispo-synchro"
+            self._thread = threading.Thread(target=self._boucle, args=(config[0],), name=nom, daemon=True)
+            self._thread.start()
+
+METRIQUES.decrire("salledispo_flux_total", "counter", "Téléchargements de flux ICS distants par résultat")
+
+# =========================================================
+# 🏢 BÂTIMENTS
+# =========================================================
+# Chaque bâtiment est un "shard" indépendant : son dossier ICS, son config.json, son snapshot
+# binaire des calendriers et son propre thread de fond. Un écran TV ne lit que son bâtiment
+# (/tv/<batiment>), et une modification dans un bâtiment ne recalcule que ce bâtiment.
+# Le bâtiment principal est le dossier historique DOSSIER_CIBLE (config.json, calendriers.snap,
+# flux.json). Les autres sont déclarés dans batiments.json (relu au démarrage uniquement) :
+# {"B": {"nom_complet": "Bâtiment B", "dossier": "salleICS/B", "config": "salleICS/B/config.json", "flux": "flux_B.json"}}
+# Par défaut : dossier salleICS/<id>/, config.json dans ce dossier, pas de flux.
+ID_BATIMENT_DEFAUT = "principal"
+NOM_BATIMENT_VALIDE = re.compile(r'^[\w\-]+$')
+IDS_BATIMENT_RESERVES = {ID_BATIMENT_DEFAUT, "stream"} # "stream" : /tv/stream est le flux SSE
+
+class Batiment:
+    """Un bâtiment : dossier ICS, registre des salles, snapshot des calendriers, tâches de fond."""
+    def __init__(self, id, nom_complet, dossier, chemin_config, fichier_snapshot, fichier_flux=None):
+        self.id = id
+        self.nom_complet = nom_complet
+        self.dossier = dossier
+        self.fichier_snapshot = fichier_snapshot
+        self.registre = RegistreSalles(chemin_config)
+        self.service = ServiceStatuts(self)
+        self.synchro = SynchroFlux(fichier_flux, dossier, id) if fichier_flux else None
+        self.index_filtres = None # IndexFiltres du dernier appel (voir obtenir_index_filtres)
+
+    @property
+    def principal(self):
+        return self.id == ID_BATIMENT_DEFAUT
+
+    @property
+    def parametre(self):
+        """Valeur de ?batiment= dans les URL (None pour le bâtiment principal : URL inchangées)."""
+        return None if self.principal else self.id
+
+    def chemin(self, fichier):
+        return os.path.join(self.dossier, fichier)
+
+    def cle_salle(self, nom_simple):
+        """Clé de la salle dans le journal des incidents (préfixée hors bâtiment principal : '103' existe partout)."""
+        return nom_simple if self.principal else f"{self.id}/{nom_simple}"
+
+    def demarrer(self):
+        self.service.demarrer()
+        if self.synchro is not None: self.synchro.demarrer()
+
+def charger_batiments(chemin):
+    """Bâtiments supplémentaires déclarés dans batiments.json ({id: Batiment}), vide si absent ou invalide."""
+    if not chemin or not os.path.exists(chemin): return {}
+    try:
+        with open(chemin, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        journaliser_erreur("config", f"Erreur lecture {chemin} : {e}")
+        return {}
+    racine = os.path.dirname(os.path.abspath(chemin))
+    def relatif(p):
+        # Les chemins relatifs sont pris par rapport à batiments.json
+        return os.path.join(racine, p) if p else None
+    base_snapshot, extension = os.path.splitext(FICHIER_SNAPSHOT_ICS)
+    batiments = {}
+    for id, infos in data.items():
+        if id.startswith('_'): continue # Commentaires (ex : "_README")
+        if not NOM_BATIMENT_VALIDE.match(id) or id in IDS_BATIMENT_RESERVES or not isinstance(infos, dict):
+            journaliser_erreur("config", f"Bâtiment invalide dans {chemin} : {id!r}")
+            continue
+        dossier = relatif(infos.get("dossier")) or os.path.join(DOSSIER_CIBLE, id)
+        batiments[id] = Batiment(id, infos.get("nom_complet", f"Bâtiment {id}"), dossier,
+                                 relatif(infos.get("config")) or os.path.join(dossier, "config.json"),
+                                 f"{base_snapshot}-{id}{extension}" if FICHIER_SNAPSHOT_ICS else "",
+                                 relatif(infos.get("flux")))
+    return batiments
+
+BATIMENT_DEFAUT = Batiment(ID_BATIMENT_DEFAUT, "Bâtiment principal", DOSSIER_CIBLE, FICHIER_CONFIG,
+                           FICHIER_SNAPSHOT_ICS, FICHIER_FLUX)
+BATIMENTS = charger_batiments(FICHIER_BATIMENTS) # Bâtiments supplémentaires, dans l'ordre du fichier
+
+def tous_les_batiments():
+    """Bâtiment principal puis bâtiments supplémentaires."""
+    return [BATIMENT_DEFAUT, *BATIMENTS.values()]
+
+def batiment_demande(valeur):
+    """Bâtiment désigné par un paramètre d'URL (absent = bâtiment principal), ou None s'il est inconnu."""
+    if not valeur or valeur == ID_BATIMENT_DEFAUT: return BATIMENT_DEFAUT
+    return BATIMENTS.get(valeur)
+
+@app.before_request
+def demarrer_services():
+    """Démarre (une seule fois par processus) les services de fond dès la première requête."""
+    for batiment in tous_les_batiments():
+        batiment.demarrer()
+    if SSE_ACTIF: DIFFUSEUR_SSE.demarrer()
+
+if METRIQUES_ACTIVES:
+    @app.before_request
+    def debut_chronometre():
+        g.debut_requete = time.perf_counter()
+
+    @app.after_request
+    def ajouter_metriques(reponse):
+        """Durée de la requête (histogramme par route) et en-tête Server-Timing des étapes."""
+        debut = g.get('debut_requete')
+        if debut is None: return reponse
+        duree = time.perf_counter() - debut
+        route = request.url_rule.rule if request.url_rule is not None else "inconnue"
+        METRIQUES.observer("salledispo_requete_duree_secondes", (("route", route),), duree)
+        METRIQUES.incrementer("salledispo_requetes_total", (("route", route), ("code", reponse.status_code)))
+        etapes = [f'{etape};dur={cumul[0] * 1000:.2f};desc="x{cumul[1]}"' for etape, cumul in g.get('server_timing', {}).items()]
+        reponse.headers['Server-Timing'] = ", ".join(etapes + [f"total;dur={duree * 1000:.2f}"])
+        return reponse
+
+# =========================================================
+# 🔎 RECHERCHE DE CRÉNEAUX LIBRES (MULTI-SALLES)
+# =========================================================
+# "Trouver une salle libre 2h cette semaine" : pour chaque jour, on fusionne en un seul
+# balayage les intervalles occupés (déjà triés) de toutes les salles candidates, et on en
+# déduit les trous de chaque salle pendant les heures d'ouverture.
+HEURE_OUVERTURE = 8          # Les créneaux proposés commencent au plus tôt à 8h...
+HEURE_FERMETURE = 20         # ... et finissent au plus tard à 20h
+JOURS_MAX_RECHERCHE = 31     # Taille max de la plage de dates d'une recherche
+TAILLE_MAX_CACHE_CRENEAUX = 256
+
+# (jour, bâtiment, fichiers candidats, génération de ses ICS) -> {fichier: [(debut, fin), ...]}
+CACHE_CRENEAUX = CacheLRU(TAILLE_MAX_CACHE_CRENEAUX)
+
+def creneaux_libres_jour(jour, fichiers, batiment=None):
+    """
+    Trous (epochs) de chaque salle sur les heures d'ouverture d'un jour, quelle que soit
+    leur durée. Balayage unique des événements de toutes les salles fusionnés par début.
+    """
+    tz_paris = pytz.timezone('Europe/Paris')
+    ouverture = tz_paris.localize(datetime.combine(jour, datetime.min.time()).replace(hour=HEURE_OUVERTURE)).timestamp()
+    fermeture = tz_paris.localize(datetime.combine(jour, datetime.min.time()).replace(hour=HEURE_FERMETURE)).timestamp()
+
+    batiment = batiment or BATIMENT_DEFAUT
+    flux = []
+    curseurs = {} # fichier -> fin de la dernière occupation vue (début du trou potentiel)
+    for f in fichiers:
+        try:
+            calendrier = CACHE_ICS.get(batiment.chemin(f))
+        except Exception:
+            continue # Fichier illisible : on ne peut rien garantir, la salle n'est pas proposée
+        curseurs[f] = ouverture
+        flux.append([(debut, fin, f) for debut, fin, _ in calendrier.entre(ouverture, fermeture) if fin > debut])
+
+    trous = {f: [] for f in curseurs}
+    for debut, fin, f in heapq.merge(*flux, key=lambda e: e[0]):
+        if debut > curseurs[f]:
+            trous[f].append((curseurs[f], debut))
+        curseurs[f] = max(curseurs[f], fin)
+    for f, curseur in curseurs.items():
+        if curseur < fermeture:
+            trous[f].append((curseur, fermeture))
+    return trous
+
+def chercher_creneaux_libres(fichiers, jour_debut, jour_fin, duree_min, batiment=None):
+    """
+    Créneaux libres d'au moins duree_min minutes, du jour_debut au jour_fin inclus.
+    Retourne {fichier: [(debut, fin), ...]} (epochs), sans les créneaux déjà passés.
+    """
+    batiment = batiment or BATIMENT_DEFAUT
+    cle_fichiers = tuple(fichiers)
+    maintenant = time.time()
+    duree = duree_min * 60
+    resultat = {}
+    jour = jour_debut
+    while jour <= jour_fin:
+        cle = (jour, batiment, cle_fichiers, batiment.service.generation)
+        trous = CACHE_CRENEAUX.get(cle)
+        if trous is None:
+            trous = creneaux_libres_jour(jour, fichiers, batiment)
+            CACHE_CRENEAUX.set(cle, trous)
+        for f, creneaux in trous.items():
+            for debut, fin in creneaux:
+                debut = max(debut, maintenant) # Aujourd'hui : on ne propose pas le passé
+                if fin - debut >= duree:
+                    resultat.setdefault(f, []).append((debut, fin))
+        jour += timedelta(days=1)
+    return resultat
+
+# =========================================================
+# 📊 MATRICE D'OCCUPATION (VUE CAMPUS, NUMPY)
+# =========================================================
+# Salles en lignes, cases de 15 minutes en colonnes, chaque cellule = fraction occupée de la case.
+# Les intervalles de toutes les salles sont rastérisés d'un bloc (NumPy) : pas de boucle Python
+# par événement, un semestre de calendriers se calcule en une fraction de seconde.
+PAS_OCCUPATION_MIN = 15           # Taille d'une case (minutes)
+PAS_OCCUPATION_AUTORISES = (15, 30, 60)
+JOURS_MAX_OCCUPATION = 184        # Un semestre
+MAX_COLONNES_HEATMAP = 1344       # Au-delà, la vue agrège les cases (l'export garde le pas demandé)
+CACHE_OCCUPATION = CacheLRU(8)
+
+def matrice_occupation(fichiers, debut, nb_cases, pas, batiment=None):
+    """
+    Matrice float32 [salle, case] : fraction de chaque case de 'pas' secondes occupée par un cours,
+    à partir de l'epoch 'debut'. Ligne à NaN si le calendrier de la salle est illisible.
+    """
+    batiment = batiment or BATIMENT_DEFAUT
+    fin = debut + nb_cases * pas
+    matrice = np.zeros((len(fichiers), nb_cases), dtype=np.float32)
+    lignes, debuts, fins = [], [], []
+    for ligne, f in enumerate(fichiers):
+        try:
+            calendrier = CACHE_ICS.get(batiment.chemin(f))
+        except Exception:
+            matrice[ligne] = np.nan
+            continue
+        d = np.frombuffer(calendrier.index.debuts, dtype=np.int64)
+        e = np.frombuffer(calendrier.index.fins, dtype=np.int64)
+        garde = (e > debut) & (d < fin)
+        occurrences = calendrier.occurrences(debut, fin)
+        if occurrences:
+            d = np.concatenate([d[garde], np.fromiter((o[0] for o in occurrences), np.int64, len(occurrences))])
+            e = np.concatenate([e[garde], np.fromiter((o[1] for o in occurrences), np.int64, len(occurrences))])
+        else:
+            d, e = d[garde], e[garde]
+        lignes.append(np.full(len(d), ligne, dtype=np.int64))
+        debuts.append(d)
+        fins.append(e)
+    if not lignes: return matrice
+
+    lignes = np.concatenate(lignes)
+    # Positions en unités de case, bornées à la fenêtre
+    a = (np.clip(np.concatenate(debuts), debut, fin) - debut) / pas
+    b = (np.clip(np.concatenate(fins), debut, fin) - debut) / pas
+    utiles = b > a # Événements ponctuels ou hors fenêtre : aucune contribution
+    lignes, a, b = lignes[utiles], a[utiles], b[utiles]
+    ia = np.floor(a).astype(np.int64)
+    ib = np.minimum(np.floor(b).astype(np.int64), nb_cases) # b == fin tombe dans la case tampon
+
+    # Cases pleines (ia+1 .. ib-1) : tableau de différences puis somme cumulée par ligne ;
+    # cases partielles aux deux bouts : ajout direct. Une colonne tampon absorbe les débordements.
+    largeur = nb_cases + 1
+    taille = len(fichiers) * largeur
+    meme_case = ia == ib
+    partiel = np.bincount(lignes * largeur + ia, np.where(meme_case, b - a, ia + 1 - a), minlength=taille)
+    partiel += np.bincount(lignes * largeur + ib, np.where(meme_case, 0.0, b - ib), minlength=taille)
+    plein = ~meme_case
+    differences = np.bincount(lignes[plein] * largeur + ia[plein] + 1, minlength=taille).astype(np.float64)
+    differences -= np.bincount(lignes[plein] * largeur + ib[plein], minlength=taille)
+    cumul = np.cumsum(differences.reshape(len(fichiers), largeur), axis=1)
+    occupation = (cumul + partiel.reshape(len(fichiers), largeur))[:, :nb_cases]
+    # Des cours superposés dans une même salle ne rendent pas la case "plus qu'occupée"
+    return np.where(np.isnan(matrice), np.nan, np.minimum(occupation, 1.0)).astype(np.float32)
+
+def obtenir_occupation(jour, nb_jours, pas_min, batiment=None):
+    """
+    Matrice d'occupation de toutes les salles d'un bâtiment, à partir de minuit (Paris) du jour donné.
+    Retourne (fichiers, epoch de début, pas en secondes, matrice), mis en cache par génération des ICS.
+    """
+    batiment = batiment or BATIMENT_DEFAUT
+    fichiers = batiment.service.obtenir().fichiers
+    cle = (jour, nb_jours, pas_min, batiment, tuple(fichiers), batiment.service.generation)
+    resultat = CACHE_OCCUPATION.get(cle)
+    if resultat is None:
+        tz_paris = pytz.timezone('Europe/Paris')
+        debut = int(_debut_jour(jour, tz_paris))
+        # Les jours de changement d'heure ne font pas 24h : on couvre jusqu'au minuit du dernier jour
+        fin = int(_debut_jour(jour + timedelta(days=nb_jours), tz_paris))
+        pas = pas_min * 60
+        resultat = (fichiers, debut, pas, matrice_occupation(fichiers, debut, -(-(fin - debut) // pas), pas, batiment))
+        CACHE_OCCUPATION.set(cle, resultat)
+    return resultat
+
+def moyenne_connue(matrice, axe):
+    """Moyenne qui ignore les cases inconnues (NaN) ; NaN si toute la tranche est inconnue."""
+    connues = ~np.isnan(matrice)
+    with np.errstate(invalid='ignore'):
+        return np.where(connues, matrice, 0).sum(axis=axe) / connues.sum(axis=axe)
+
+def parametres_occupation():
+    """Lit debut / jours / pas dans la requête. Lève ValueError si invalides."""
+    tz_paris = pytz.timezone('Europe/Paris')
+    jour = datetime.strptime(request.args['debut'], "%Y-%m-%d").date() if request.args.get('debut') else datetime.now(tz_paris).date()
+    nb_jours = int(request.args.get('jours', 7))
+    pas_min = int(request.args.get('pas', PAS_OCCUPATION_MIN))
+    if not 1 <= nb_jours <= JOURS_MAX_OCCUPATION or pas_min not in PAS_OCCUPATION_AUTORISES:
+        raise ValueError("plage ou pas invalide")
+    return jour, nb_jours, pas_min
+
+# =========================================================
+# 🗜️ CACHE DE RENDU (PAGES HTML)
+# =========================================================
+# Tous les écrans TV d'un bâtiment (et tous les tableaux de bord sans filtre) affichent la même page :
+# elle est rendue une seule fois par version du snapshot et par minute (barres de progression,
+# "Prochain : ..."), puis servie telle quelle, déjà compressée, à chaque client.
+TAILLE_MAX_CACHE_RENDU = 32 # Pages gardées en mémoire (chacune avec ses variantes compressées)
+CACHE_RENDU = CacheLRU(TAILLE_MAX_CACHE_RENDU)
+# La clé ne dépend que de données serveur (jamais d'en-têtes libres comme Host) : un client ne
+# peut pas remplir le cache de variantes. Un verrou par clé : deux pages différentes se rendent en parallèle.
+_VERROUS_RENDU = {} # clé -> verrou du rendu en cours
+_VERROU_RENDU = threading.Lock() # Protège _VERROUS_RENDU
+
+def encodage_accepte():
+    """Meilleur encodage accepté par le client parmi br (si brotli est installé), gzip et identity."""
+    if brotli is not None and request.accept_encodings['br']: return 'br'
+    if request.accept_encodings['gzip']: return 'gzip'
+    return 'identity'
+
+def compresser(corps, encodage):
+    if encodage == 'br': return brotli.compress(corps, quality=5)
+    if encodage == 'gzip': return gzip.compress(corps, compresslevel=6, mtime=0)
+    return corps
+
+def reponse_page_en_cache(cle, rendre):
+    """
+    Réponse HTML servie depuis le cache de rendu. 'rendre' (template -> str) n'est appelée
+    qu'une fois par clé, même si plusieurs écrans arrivent en même temps.
+    """
+    page = CACHE_RENDU.get(cle)
+    if page is None:
+        with _VERROU_RENDU:
+            verrou = _VERROUS_RENDU.setdefault(cle, threading.Lock())
+        with verrou:
+            page = CACHE_RENDU.get(cle)
+            if page is None:
+                page = {'identity': rendre().encode('utf-8')} # encodage -> corps
+                CACHE_RENDU.set(cle, page)
+        with _VERROU_RENDU:
+            _VERROUS_RENDU.pop(cle, None)
+    encodage = encodage_accepte()
+    corps = page.get(encodage)
+    if corps is None:
+        corps = page[encodage] = compresser(page['identity'], encodage)
+    reponse = app.response_class(corps, mimetype='text/html')
+    if encodage != 'identity': reponse.headers['Content-Encoding'] = encodage
+    reponse.vary.add('Accept-Encoding')
+    return reponse
+
 # =========================================================
 # 🚦 ROUTES FLASK (CONTROLLERS)
 # =========================================================
@@ -367,12 +2401,27 @@ def index():
     """
     PAGE D'ACCUEIL (Tableau de bord).
     Affiche la liste des salles avec leur statut en temps réel.
-    Gère les filtres (Recherche, PC, Projecteur, Temps...).
+    Gère les filtres (Bâtiment, Recherche, PC, Projecteur, Temps...).
     """
-    if not os.path.exists(DOSSIER_CIBLE): return f"Erreur dossier ICS"
-    tous_fichiers = os.listdir(DOSSIER_CIBLE)
-    fichiers_ics = [f for f in tous_fichiers if f.lower().endswith('.ics')]
-    
+    f_batiment = request.args.get('batiment')
+    if f_batiment:
+        batiment = batiment_demande(f_batiment)
+        if batiment is None: return "Bâtiment inconnu", 404
+        batiments = [batiment] # Seul ce bâtiment est lu : coût proportionnel à sa taille
+    else:
+        batiments = tous_les_batiments()
+    if not any(os.path.exists(b.dossier) for b in batiments): return f"Erreur dossier ICS"
+    selection = [(b, b.service.obtenir()) for b in batiments]
+
+    # Vue sans autre filtre : identique pour tous les chargements d'un même utilisateur dans la minute
+    if not request.args.keys() - {'batiment'}:
+        cle = ('index', current_user.id, f_batiment, int(time.time() // 60), REGISTRE_INCIDENTS.version(),
+               tuple((b.id, snapshot.version, b.registre.verifier()) for b, snapshot in selection))
+        return reponse_page_en_cache(cle, lambda: rendre_index(selection))
+    return rendre_index(selection)
+
+def rendre_index(selection):
+    """Rendu du tableau de bord pour les filtres de la requête courante ; selection : [(bâtiment, snapshot)]."""
     # Récupération des paramètres GET (Filtres)
     q = request.args.get('q')
     f_pc = request.args.get('pc')
@@ -400,106 +2449,529 @@ def index():
 
     liste_salles = []
     
-    # Boucle principale sur chaque fichier salle
-    for f in fichiers_ics:
-        nom_simple = f.replace('.ics', '').replace('.ICS', '')
-        infos = get_infos_manuelles(nom_simple)
-        etage, aile = detecter_etage_aile(nom_simple, infos)
-        
-        # Application des filtres
-        keep = True
-        if q and q.lower() not in nom_simple.lower(): keep = False
-        if f_pc and not infos.get('pc'): keep = False
-        if f_proj and not infos.get('projecteur'): keep = False
-        if f_etage and f_etage != "" and str(etage) != f_etage: keep = False
-        if f_aile and f_aile != "" and aile != f_aile: keep = False
-        
-        # Filtre de disponibilité complexe
-        if keep and req_start and req_end:
-            if not verifier_dispo_creneau(f, req_start, req_end): keep = False
-
-        # Si la salle correspond aux critères, on calcule son statut
-        if keep:
-            status = get_salle_status(f)
-            incidents = get_reports(nom_simple)
-            infos['has_issue'] = (len(incidents) > 0)
-            
-            infos['etage_calc'] = etage
-            infos['aile_calc'] = aile
-            liste_salles.append({'nom': nom_simple, 'fichier': f, 'status': status, 'infos': infos})
+    for batiment, snapshot in selection:
+        # Filtres statiques (recherche, équipements, localisation) : intersections d'index précalculés.
+        # Le résultat est déjà trié par ordre alphabétique (bâtiment par bâtiment).
+        candidats = obtenir_index_filtres(snapshot.fichiers, batiment).filtrer(
+            q=q, pc=bool(f_pc), projecteur=bool(f_proj), etage=f_etage, aile=f_aile)
+
+        for f in candidats:
+            # Filtre de disponibilité complexe, uniquement sur les salles restantes
+            if req_start and req_end and not verifier_dispo_creneau(f, req_start, req_end, batiment): continue
 
-    # Tri alphabétique par défaut
-    liste_salles.sort(key=lambda x: x['nom'])
+            # La salle correspond aux critères : on reprend son statut depuis le snapshot
+            nom_simple = f.replace('.ics', '').replace('.ICS', '')
+            has_issue = REGISTRE_INCIDENTS.nombre_ouverts(batiment.cle_salle(nom_simple)) > 0
+            liste_salles.append({'nom': nom_simple, 'fichier': f, 'status': snapshot.statuts[f],
+                                 'infos': get_infos_manuelles(nom_simple, batiment), 'has_issue': has_issue,
+                                 'batiment': batiment.parametre, 'nom_batiment': batiment.nom_complet})
     
     return render_template('index.html', salles=liste_salles, 
                            q=q, f_pc=f_pc, f_proj=f_proj, f_etage=f_etage, f_aile=f_aile,
-                           f_duree=f_duree, f_heure_debut=f_heure_debut, f_heure_fin=f_heure_fin)
+                           f_duree=f_duree, f_heure_debut=f_heure_debut, f_heure_fin=f_heure_fin,
+                           f_batiment=request.args.get('batiment'), batiments=tous_les_batiments())
 
 @app.route('/salle/<nom_fichier>')
 @login_required
 def detail(nom_fichier):
-    """Page de détail d'une salle : Status, Infos, Planning futur et Signalements."""
+    """Page de détail d'une salle (?batiment=) : Status, Infos, Planning futur et Signalements."""
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None: return "Bâtiment inconnu", 404
     nom_simple = nom_fichier.replace('.ics', '').replace('.ICS', '')
-    etat = get_salle_status(nom_fichier)
-    infos = get_infos_manuelles(nom_simple)
-    planning = get_planning_etendu(nom_fichier)
-    etage, aile = detecter_etage_aile(nom_simple, infos)
-    incidents = get_reports(nom_simple)
+    etat = get_salle_status(nom_fichier, batiment)
+    infos = get_infos_manuelles(nom_simple, batiment)
+    planning = get_planning_etendu(nom_fichier, batiment)
+    # Curseur de l'API planning : premier jour absent de 'planning', les semaines suivantes sont chargées à la demande
+    planning_suivant = (datetime.now(pytz.timezone('Europe/Paris')).date() + timedelta(days=JOURS_PLANNING_DETAIL)).isoformat()
+    incidents = get_reports(nom_simple, batiment)
     
     return render_template('detail.html', 
                            nom=nom_simple, etat=etat, infos=infos, 
-                           planning=planning, etage_courant=etage, aile=aile,
-                           incidents=incidents)
+                           planning=planning, planning_suivant=planning_suivant,
+                           etage_courant=infos.etage, aile=infos.aile,
+                           incidents=incidents, batiment=batiment.parametre,
+                           nom_batiment=None if not BATIMENTS else batiment.nom_complet)
 
 @app.route('/signaler/<nom_salle>', methods=['POST'])
 def signaler(nom_salle):
-    """Traitement du formulaire de signalement d'incident."""
+    """Traitement du formulaire de signalement d'incident (?batiment= pour une salle hors bâtiment principal)."""
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None: return "Bâtiment inconnu", 404
     type_pb = request.form.get('type_probleme')
     description = request.form.get('description')
-    if type_pb: add_report(nom_salle, type_pb, description)
-        
+    if type_pb: add_report(nom_salle, type_pb, description, batiment)
+    return redirection_detail(nom_salle, batiment)
+
+@app.route('/signaler/<nom_salle>/resolu/<id_incident>', methods=['POST'])
+@login_required
+def resoudre_signalement(nom_salle, id_incident):
+    """Clôture d'un incident depuis la page détail (il n'est plus compté sur le tableau de bord)."""
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None: return "Bâtiment inconnu", 404
+    close_report(nom_salle, id_incident, batiment) # Déjà résolu (double clic, autre onglet) : rien à faire
+    return redirection_detail(nom_salle, batiment)
+
+def redirection_detail(nom_salle, batiment):
+    """Redirige vers la page détail de la salle."""
     fichier_redir = f"{nom_salle}.ics"
     # Recherche du bon fichier .ics pour la redirection
-    for f in os.listdir(DOSSIER_CIBLE):
+    for f in os.listdir(batiment.dossier):
         if nom_salle == f.replace('.ics', '').replace('.ICS', ''):
             fichier_redir = f
             break
-    return redirect(url_for('detail', nom_fichier=fichier_redir))
+    return redirect(url_for('detail', nom_fichier=fichier_redir, batiment=batiment.parametre))
+
+@app.route('/occupation')
+@login_required
+def occupation():
+    """Heatmap de l'occupation d'un bâtiment (salles x cases de temps), pour le service logistique."""
+    batiment = batiment_demande(request.args.get('batiment'))
+    try:
+        jour, nb_jours, pas_min = parametres_occupation()
+        if batiment is None: raise ValueError("bâtiment inconnu")
+    except ValueError:
+        return redirect(url_for('occupation')) # Paramètres invalides : retour à la vue par défaut
+    fichiers, debut, pas, matrice = obtenir_occupation(jour, nb_jours, pas_min, batiment)
+
+    # Trop de colonnes pour l'écran : on agrège les cases voisines (moyenne)
+    facteur = -(-matrice.shape[1] // MAX_COLONNES_HEATMAP)
+    if facteur > 1:
+        manquantes = -matrice.shape[1] % facteur
+        complete = np.pad(matrice, ((0, 0), (0, manquantes)), constant_values=np.nan)
+        matrice = moyenne_connue(complete.reshape(len(fichiers), -1, facteur), 2)
+
+    noms = [get_infos_manuelles(f.replace('.ics', '').replace('.ICS', ''), batiment).nom for f in fichiers]
+    moyennes = [None if np.isnan(v) else round(float(v) * 100) for v in moyenne_connue(matrice, 1)]
+    # Centièmes entiers (-1 = inconnu) : la page reste légère même sur un semestre
+    cellules = np.where(np.isnan(matrice), -1, np.rint(matrice * 100)).astype(np.int16).tolist()
+    return render_template('occupation.html', noms=noms, fichiers=fichiers, moyennes=moyennes, cellules=cellules,
+                           debut=debut * 1000, pas_affichage=pas * facteur * 1000,
+                           jour=jour.isoformat(), nb_jours=nb_jours, pas_min=pas_min,
+                           pas_autorises=PAS_OCCUPATION_AUTORISES, jours_max=JOURS_MAX_OCCUPATION,
+                           batiment=batiment.parametre, batiments=tous_les_batiments())
+
+@app.route('/occupation/export')
+@login_required
+def occupation_export():
+    """
+    Export de la matrice d'occupation (?format=csv|json, ?mode=fraction|binaire).
+    En mode binaire, une case vaut 1 dès qu'un cours la touche.
+    """
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None:
+        return jsonify({"erreur": "Bâtiment inconnu"}), 404
+    try:
+        jour, nb_jours, pas_min = parametres_occupation()
+    except ValueError:
+        return jsonify({"erreur": f"Paramètres invalides (1 à {JOURS_MAX_OCCUPATION} jours, pas de 15, 30 ou 60 min)"}), 400
+    fichiers, debut, pas, matrice = obtenir_occupation(jour, nb_jours, pas_min, batiment)
+    binaire = request.args.get('mode') == 'binaire'
+    if binaire:
+        matrice = np.where(np.isnan(matrice), np.nan, matrice > 0)
+
+    tz_paris = pytz.timezone('Europe/Paris')
+    cases = [datetime.fromtimestamp(debut + k * pas, tz_paris).isoformat(timespec='minutes') for k in range(matrice.shape[1])]
+    nom_export = f"occupation_{jour.isoformat()}_{nb_jours}j" if batiment.principal else f"occupation_{batiment.id}_{jour.isoformat()}_{nb_jours}j"
+
+    if request.args.get('format') == 'json':
+        inconnues = np.isnan(matrice)
+        if binaire:
+            valeurs = np.where(inconnues, 0, matrice).astype(np.int8).astype(object)
+        else:
+            valeurs = np.round(matrice.astype(np.float64), 3).astype(object)
+        valeurs[inconnues] = None # Salle illisible : null
+        return jsonify({"debut": cases[0] if cases else None, "pas_minutes": pas_min,
+                        "mode": "binaire" if binaire else "fraction", "cases": cases,
+                        "salles": fichiers, "matrice": valeurs.tolist()})
+
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon)
+    ecrivain.writerow(["salle"] + cases)
+    format_cellule = "%d" if binaire else "%.3g"
+    for f, ligne in zip(fichiers, matrice):
+        ecrivain.writerow([f.replace('.ics', '').replace('.ICS', '')] + ["" if np.isnan(v) else format_cellule % v for v in ligne])
+    return Response(tampon.getvalue(), mimetype='text/csv',
+                    headers={"Content-Disposition": f"attachment; filename={nom_export}.csv"})
 
 # =========================================================
 # 📺 ROUTE TV (MODE KIOSQUE)
 # =========================================================
 @app.route('/tv')
-def tv_mode():
+@app.route('/tv/<batiment>')
+def tv_mode(batiment=None):
     """
-    Mode Affichage Dynamique (Digital Signage).
+    Mode Affichage Dynamique (Digital Signage), pour le bâtiment principal ou /tv/<batiment>.
     Cette route n'est PAS protégée par @login_required pour permettre
     l'affichage sur des écrans sans clavier/souris.
     """
-    if not os.path.exists(DOSSIER_CIBLE): return "Erreur dossier"
-    tous_fichiers = os.listdir(DOSSIER_CIBLE)
-    fichiers_ics = [f for f in tous_fichiers if f.lower().endswith('.ics')]
-    
+    batiment = batiment_demande(batiment)
+    if batiment is None: return "Bâtiment inconnu", 404
+    if not os.path.exists(batiment.dossier): return "Erreur dossier"
+    snapshot = batiment.service.obtenir()
+    # Même page pour tous les écrans du bâtiment : rendue une fois par version du snapshot et par minute
+    cle = ('tv', batiment.id, snapshot.version, int(time.time() // 60), batiment.registre.verifier())
+    return reponse_page_en_cache(cle, lambda: rendre_tv(snapshot, batiment))
+
+def rendre_tv(snapshot, batiment=None):
+    """Rendu de la page TV d'un bâtiment à partir de son snapshot."""
+    batiment = batiment or BATIMENT_DEFAUT
     liste_salles = []
     
-    for f in fichiers_ics:
+    for f in snapshot.fichiers:
         nom_simple = f.replace('.ics', '').replace('.ICS', '')
-        infos = get_infos_manuelles(nom_simple)
-        status = get_salle_status(f)
-        etage, aile = detecter_etage_aile(nom_simple, infos)
-        
-        infos['etage_calc'] = etage
-        infos['aile_calc'] = aile
-        
-        liste_salles.append({'nom': nom_simple, 'status': status, 'infos': infos})
+        infos = get_infos_manuelles(nom_simple, batiment)
+        status = snapshot.statuts[f]
+        liste_salles.append({'nom': nom_simple, 'fichier': f, 'status': status, 'infos': infos})
 
     # TRI SPÉCIFIQUE TV :
     # 1. Les salles LIBRES en priorité (pour lecture rapide)
     # 2. Puis tri alphabétique
     liste_salles.sort(key=lambda x: (0 if x['status']['etat'] == 'LIBRE' else 1, x['nom']))
     
-    return render_template('tv.html', salles=liste_salles)
+    # Données brutes pour la mise à jour en place des cartes (sans rechargement de page)
+    salles_json = [salle_json(s['fichier'], snapshot.statuts[s['fichier']], batiment) for s in liste_salles]
+    return render_template('tv.html', salles=liste_salles, salles_json=salles_json, version=snapshot.version,
+                           url_sse=url_flux_sse(batiment), url_status=url_for('api_status', batiment=batiment.parametre),
+                           nom_batiment=None if batiment.principal else batiment.nom_complet)
+
+# =========================================================
+# 🔌 API JSON (ÉCRANS TV, INTÉGRATIONS)
+# =========================================================
+# Réponses compactes avec ETag fort dérivé de la version du snapshot : un client qui
+# renvoie If-None-Match reçoit un 304 vide tant que rien n'a changé.
+# Ces routes ne sont pas protégées, comme /tv : elles n'exposent que l'état des salles.
+# Toutes portent sur un seul bâtiment : ?batiment=<id> (bâtiment principal par défaut).
+
+def salle_json(fichier, statut, batiment=None):
+    """Représentation JSON compacte d'une salle : infos d'affichage + statut courant."""
+    nom_simple = fichier.replace('.ics', '').replace('.ICS', '')
+    infos = get_infos_manuelles(nom_simple, batiment)
+    return {"fichier": fichier, "nom": nom_simple, "nom_complet": infos.nom_complet,
+            "etage": infos.etage, "aile": infos.aile, "pc": infos.pc, "projecteur": infos.projecteur,
+            **statut}
+
+def reponse_conditionnelle(donnees, version):
+    """Réponse JSON avec ETag fort ; 304 si le client possède déjà cette version."""
+    reponse = jsonify(donnees)
+    reponse.set_etag(f"v{version}")
+    reponse.headers['Cache-Control'] = 'no-cache' # Toujours revalider, mais le 304 évite le corps
+    return reponse.make_conditional(request)
+
+@app.route('/api/status')
+def api_status():
+    """
+    Statut de toutes les salles.
+    ?since=<version> : ne renvoie que les salles dont le statut a changé depuis cette version
+    ('fichiers' liste toujours toutes les salles, pour détecter les suppressions).
+    """
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None:
+        return jsonify({"erreur": "Bâtiment inconnu"}), 404
+    snapshot = batiment.service.obtenir()
+    since = request.args.get('since', type=int)
+    if since is not None and since > snapshot.version:
+        since = None # Version inconnue (autre processus, horloge...) : on renvoie tout
+
+    fichiers = snapshot.fichiers
+    if since is not None:
+        fichiers = [f for f in fichiers if snapshot.versions[f] > since]
+
+    donnees = {
+        "version": snapshot.version,
+        "horodatage": int(snapshot.horodatage),
+        "complet": since is None,
+        "fichiers": snapshot.fichiers,
+        "salles": [salle_json(f, snapshot.statuts[f], batiment) for f in fichiers],
+    }
+    # Le corps dépend de 'since' : chaque delta a son propre ETag (v<version>-<since>)
+    return reponse_conditionnelle(donnees, snapshot.version if since is None else f"{snapshot.version}-{since}")
+
+@app.route('/api/creneaux-libres')
+@login_required
+def api_creneaux_libres():
+    """
+    Recherche multi-salles de créneaux libres.
+    Paramètres : debut / fin (AAAA-MM-JJ, fin incluse, défaut : 7 jours à partir d'aujourd'hui),
+    duree_min (minutes, défaut 60) et les filtres du tableau de bord (batiment, q, pc, proj, etage, aile).
+    """
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None:
+        return jsonify({"erreur": "Bâtiment inconnu"}), 404
+    tz_paris = pytz.timezone('Europe/Paris')
+    aujourdhui = datetime.now(tz_paris).date()
+    try:
+        jour_debut = datetime.strptime(request.args['debut'], "%Y-%m-%d").date() if request.args.get('debut') else aujourdhui
+        jour_fin = datetime.strptime(request.args['fin'], "%Y-%m-%d").date() if request.args.get('fin') else jour_debut + timedelta(days=6)
+        duree_min = int(request.args.get('duree_min', 60))
+    except ValueError:
+        return jsonify({"erreur": "Paramètres invalides (dates AAAA-MM-JJ, duree_min en minutes)"}), 400
+    if jour_fin < jour_debut or (jour_fin - jour_debut).days >= JOURS_MAX_RECHERCHE or duree_min <= 0:
+        return jsonify({"erreur": f"Plage de 1 à {JOURS_MAX_RECHERCHE} jours et durée positive attendues"}), 400
+
+    snapshot = batiment.service.obtenir()
+    candidats = obtenir_index_filtres(snapshot.fichiers, batiment).filtrer(
+        q=request.args.get('q'), pc=bool(request.args.get('pc')), projecteur=bool(request.args.get('proj')),
+        etage=request.args.get('etage'), aile=request.args.get('aile'))
+    creneaux = chercher_creneaux_libres(candidats, jour_debut, jour_fin, duree_min, batiment)
+
+    salles = []
+    for f in candidats:
+        if f not in creneaux: continue
+        infos = get_infos_manuelles(f.replace('.ics', '').replace('.ICS', ''), batiment)
+        salles.append({
+            "fichier": f, "nom": infos.nom, "nom_complet": infos.nom_complet,
+            "creneaux": [{"debut": datetime.fromtimestamp(d, tz_paris).isoformat(timespec='minutes'),
+                          "fin": datetime.fromtimestamp(fin, tz_paris).isoformat(timespec='minutes'),
+                          "minutes": int((fin - d) // 60)} for d, fin in creneaux[f]],
+        })
+    return jsonify({"debut": jour_debut.isoformat(), "fin": jour_fin.isoformat(),
+                    "duree_min": duree_min, "salles": salles})
+
+@app.route('/metrics')
+def metriques():
+    """Métriques au format Prometheus (404 si SALLEDISPO_METRIQUES n'est pas activé)."""
+    if not METRIQUES_ACTIVES:
+        return jsonify({"erreur": "Métriques désactivées (SALLEDISPO_METRIQUES=1)"}), 404
+    jauges = []
+    for nom, cache in (("ics", CACHE_ICS), ("rendu", CACHE_RENDU), ("creneaux", CACHE_CRENEAUX), ("occupation", CACHE_OCCUPATION)):
+        stats = cache.stats()
+        labels = (("cache", nom),)
+        jauges += [("salledispo_cache_hits_total", labels, stats["hits"]),
+                   ("salledispo_cache_misses_total", labels, stats["misses"]),
+                   ("salledispo_cache_entrees", labels, stats["taille"])]
+    jauges.append(("salledispo_clients_sse", (), DIFFUSEUR_SSE.nb_clients()))
+    return Response(METRIQUES.exporter(jauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/salle/<nom>')
+def api_salle(nom):
+    """Statut d'une salle (nom simple '103' ou nom de fichier '103.ics')."""
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None:
+        return jsonify({"erreur": "Bâtiment inconnu"}), 404
+    snapshot = batiment.service.obtenir()
+    nom_simple = nom.replace('.ics', '').replace('.ICS', '')
+    for f in (f"{nom_simple}.ics", f"{nom_simple}.ICS"):
+        if f in snapshot.statuts:
+            return reponse_conditionnelle(salle_json(f, snapshot.statuts[f], batiment), snapshot.versions[f])
+    return jsonify({"erreur": "Salle introuvable"}), 404
+
+@app.route('/api/salle/<nom>/planning')
+@login_required
+def api_planning(nom):
+    """
+    Planning d'une salle, paginé par curseur : ?from=AAAA-MM-JJ (aujourd'hui par défaut)&days=N (7 par défaut).
+    'suivant' donne le curseur de la page d'après ; les jours déjà formatés sont servis depuis CACHE_PLANNING.
+    """
+    batiment = batiment_demande(request.args.get('batiment'))
+    if batiment is None:
+        return jsonify({"erreur": "Bâtiment inconnu"}), 404
+    snapshot = batiment.service.obtenir()
+    nom_simple = nom.replace('.ics', '').replace('.ICS', '')
+    fichier = next((f for f in (f"{nom_simple}.ics", f"{nom_simple}.ICS") if f in snapshot.statuts), None)
+    if fichier is None:
+        return jsonify({"erreur": "Salle introuvable"}), 404
+
+    aujourd_hui = datetime.now(pytz.timezone('Europe/Paris')).date()
+    try:
+        depart = datetime.strptime(request.args['from'], "%Y-%m-%d").date() if request.args.get('from') else aujourd_hui
+        nb_jours = int(request.args.get('days', 7))
+    except ValueError:
+        return jsonify({"erreur": "Paramètres invalides (from=AAAA-MM-JJ, days=entier)"}), 400
+    if not 1 <= nb_jours <= JOURS_MAX_PAGE_PLANNING:
+        return jsonify({"erreur": f"days doit être compris entre 1 et {JOURS_MAX_PAGE_PLANNING}"}), 400
+    if abs((depart - aujourd_hui).days) > JOURS_MAX_PLANNING:
+        return jsonify({"erreur": f"from doit être à moins de {JOURS_MAX_PLANNING} jours d'aujourd'hui"}), 400
+
+    chemin_complet = batiment.chemin(fichier)
+    jours = []
+    try:
+        signature = CACHE_ICS.signature(chemin_complet) # Relevée avant la lecture : l'entrée du cache peut être évincée
+        for i in range(nb_jours):
+            jour = depart + timedelta(days=i)
+            evenements = planning_jour(chemin_complet, jour)
+            jours.append({"date_iso": jour.isoformat(), "jour_joli": jour_en_lettres(jour),
+                          "cours": [{"horaire": ev["horaire"], "titre": ev["titre"], "debut": int(ev["timestamp"]),
+                                     "fin": int(fin_ev)} for fin_ev, ev in evenements]})
+    except Exception as e:
+        journaliser_erreur("planning", f"Erreur planning {fichier} : {e}")
+        return jsonify({"erreur": "Fichier corrompu"}), 500
+
+    suivant = (depart + timedelta(days=nb_jours)).isoformat()
+    donnees = {"salle": nom_simple, "from": depart.isoformat(), "days": nb_jours, "jours": jours,
+               "suivant": suivant, "url_suivant": url_for('api_planning', nom=nom_simple, days=nb_jours,
+                                                          batiment=batiment.parametre, **{'from': suivant})}
+    # Même fichier, même page => même ETag (la page ne dépend pas de l'heure courante)
+    return reponse_conditionnelle(donnees, f"{signature[0]}-{signature[1]}-{depart.isoformat()}-{nb_jours}")
+
+# =========================================================
+# 📡 FLUX TEMPS RÉEL (SERVER-SENT EVENTS)
+# =========================================================
+# Les écrans TV reçoivent les changements en push au lieu de les demander à intervalle fixe.
+# Le flux est servi par une petite boucle asyncio (stdlib) dans un thread dédié, sur son propre
+# port : des centaines de connexions inactives ne coûtent pas un thread chacune, contrairement
+# à une réponse WSGI en streaming. Il n'écoute que sur 127.0.0.1 : en production, le reverse-proxy
+# doit relayer /tv/stream vers ce port. Il ne démarre qu'avec SALLEDISPO_SSE=1 (un seul processus,
+# pas chaque worker gunicorn) ou au lancement direct (python app.py) ; sinon les TV interrogent /api/status.
+PORT_SSE = int(os.environ.get('SALLEDISPO_PORT_SSE', 5002)) # 0 = désactivé (les TV se rabattent sur /api/status)
+HOTE_SSE = os.environ.get('SALLEDISPO_HOTE_SSE', '127.0.0.1')
+SSE_ACTIF = os.environ.get('SALLEDISPO_SSE', '') not in ('', '0')
+URL_SSE = os.environ.get('SALLEDISPO_URL_SSE') # URL publique du flux (défaut : /tv/stream, relayé par le reverse-proxy)
+INTERVALLE_BATTEMENT_SSE = 15   # Secondes entre deux commentaires "ping" (garde les proxys éveillés)
+TAMPON_MAX_CLIENT_SSE = 1 << 20 # Octets en attente au-delà desquels un client trop lent est déconnecté
+
+def url_flux_sse(batiment=None):
+    """URL du flux SSE d'un bâtiment pour le navigateur : SALLEDISPO_URL_SSE, sinon /tv/stream (même origine). None si désactivé."""
+    if not (SSE_ACTIF and PORT_SSE): return None
+    url = URL_SSE or "/tv/stream"
+    if batiment is None or batiment.principal: return url
+    # SALLEDISPO_URL_SSE peut déjà porter une requête (?jeton=...) : le bâtiment y est ajouté
+    morceaux = urlsplit(url)
+    requete = "&".join(filter(None, (morceaux.query, urlencode({"batiment": batiment.id}))))
+    return urlunsplit(morceaux._replace(query=requete))
+
+def message_sse(evenement, donnees, version=None):
+    """Encode un message SSE (une seule fois, quel que soit le nombre de clients)."""
+    entete = f"id: {version}\n" if version is not None else ""
+    return f"{entete}event: {evenement}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n".encode('utf-8')
+
+def _sans_progression(statut):
+    """Statut sans la barre de progression : sert à distinguer un vrai changement d'état."""
+    return {k: v for k, v in statut.items() if k != 'progression'}
+
+class DiffuseurSSE:
+    """
+    Serveur Server-Sent Events asynchrone pour GET /tv/stream[?batiment=<id>]. Chaque client ne
+    reçoit que les salles de son bâtiment. Événements envoyés :
+    - 'salles' : à la connexion (état complet), puis les salles dont l'état a changé ;
+    - 'progression' : à chaque recalcul, {fichier: %} des salles occupées.
+    """
+    ENTETE = (b"HTTP/1.1 200 OK\r\n"
+              b"Content-Type: text/event-stream; charset=utf-8\r\n"
+              b"Cache-Control: no-cache\r\n"
+              b"Connection: keep-alive\r\n"
+              b"Access-Control-Allow-Origin: *\r\n"
+              b"X-Accel-Buffering: no\r\n\r\n"
+              b"retry: 5000\n\n")
+
+    def __init__(self, port, hote='127.0.0.1'):
+        self.port = port
+        self.hote = hote
+        self._clients = {}      # id du bâtiment -> {writers}
+        self._etats_complets = {} # id du bâtiment -> dernier message 'salles' complet, envoyé à chaque nouveau client
+        self._loop = None
+        self._thread = None
+        self._verrou = threading.Lock()
+
+    def demarrer(self):
+        """Lance la boucle asyncio dans un thread dédié (une seule fois par processus)."""
+        with self._verrou:
+            if self._thread is not None or not self.port: return
+            self._thread = threading.Thread(target=self._executer, name="salledispo-sse", daemon=True)
+            self._thread.start()
+
+    def _executer(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        # Pas de SO_REUSEPORT : chaque processus a sa propre version des statuts, le flux doit rester
+        # servi par un seul d'entre eux (un second processus activé par erreur échoue ici, sans partager les clients)
+        try:
+            loop.run_until_complete(asyncio.start_server(self._servir, self.hote, self.port))
+        except OSError as e:
+            journaliser_erreur("sse", f"Flux SSE indisponible sur le port {self.port} (déjà servi par un autre processus ?) : {e}")
+            return
+        self._loop = loop
+        loop.create_task(self._battements())
+        loop.run_forever()
+
+    def nb_clients(self):
+        return sum(len(clients) for clients in list(self._clients.values()))
+
+    def suivre(self, batiment):
+        """Abonne le diffuseur au service des statuts d'un bâtiment."""
+        batiment.service.abonner(lambda precedent, snapshot: self.publier(batiment, precedent, snapshot))
+
+    async def _servir(self, reader, writer):
+        """Gère une connexion : lecture de la requête HTTP, puis attente de la déconnexion."""
+        try:
+            ligne = await asyncio.wait_for(reader.readline(), 10)
+            while True: # En-têtes ignorés
+                entete = await asyncio.wait_for(reader.readline(), 10)
+                if entete in (b'\r\n', b'\n', b''): break
+
+            parties = ligne.decode('latin-1').split()
+            chemin, _, requete = parties[1].partition('?') if len(parties) >= 2 else ('', '', '')
+            batiment = batiment_demande(parse_qs(requete).get('batiment', [None])[0])
+            if len(parties) < 2 or parties[0] != 'GET' or chemin != '/tv/stream' or batiment is None:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+
+            if batiment.id not in self._etats_complets:
+                # Premier client avant le premier recalcul : construction hors de la boucle
+                await asyncio.get_running_loop().run_in_executor(None, self._construire_etat_complet, batiment)
+            writer.write(self.ENTETE + self._etats_complets.get(batiment.id, b""))
+            clients = self._clients.setdefault(batiment.id, set())
+            clients.add(writer)
+            while await reader.read(1024): pass # Le client n'envoie rien : on attend la fermeture
+        except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+            pass # Client muet, ligne de requête ou en-tête trop long (readline), connexion coupée
+        finally:
+            for clients in self._clients.values(): clients.discard(writer)
+            writer.close()
+
+    async def _battements(self):
+        while True:
+            await asyncio.sleep(INTERVALLE_BATTEMENT_SSE)
+            for id_batiment in list(self._clients):
+                self._diffuser(b": ping\n\n", id_batiment)
+
+    def _diffuser(self, donnees, id_batiment):
+        """Écrit le message à tous les clients du bâtiment (thread de la boucle uniquement)."""
+        clients = self._clients.get(id_batiment, set())
+        for writer in list(clients):
+            transport = writer.transport
+            if transport.is_closing() or transport.get_write_buffer_size() > TAMPON_MAX_CLIENT_SSE:
+                clients.discard(writer)
+                transport.abort()
+                continue
+            writer.write(donnees)
+
+    def _construire_etat_complet(self, batiment, snapshot=None):
+        snapshot = snapshot or batiment.service.snapshot
+        if snapshot is None: return
+        self._etats_complets[batiment.id] = message_sse('salles', {
+            "version": snapshot.version, "complet": True, "fichiers": snapshot.fichiers,
+            "salles": [salle_json(f, snapshot.statuts[f], batiment) for f in snapshot.fichiers],
+        }, snapshot.version)
+
+    def publier(self, batiment, precedent, snapshot):
+        """Abonné du ServiceStatuts d'un bâtiment : calcule le diff une fois, puis le pousse à ses clients."""
+        if self._loop is None: return
+        self._construire_etat_complet(batiment, snapshot)
+
+        messages = b""
+        changees = [f for f in snapshot.fichiers
+                    if precedent is None or f not in precedent.statuts
+                    or _sans_progression(precedent.statuts[f]) != _sans_progression(snapshot.statuts[f])]
+        supprimees = precedent is not None and set(precedent.fichiers) - set(snapshot.fichiers)
+        if changees or supprimees:
+            messages += message_sse('salles', {
+                "version": snapshot.version, "complet": False, "fichiers": snapshot.fichiers,
+                "salles": [salle_json(f, snapshot.statuts[f], batiment) for f in changees],
+            }, snapshot.version)
+        messages += message_sse('progression', {
+            "version": snapshot.version,
+            "progression": {f: st['progression'] for f, st in snapshot.statuts.items() if st['etat'] == 'OCCUPÉ'},
+        }, snapshot.version)
+        self._loop.call_soon_threadsafe(self._diffuser, messages, batiment.id)
+
+DIFFUSEUR_SSE = DiffuseurSSE(PORT_SSE, HOTE_SSE)
+for _batiment in tous_les_batiments():
+    DIFFUSEUR_SSE.suivre(_batiment)
 
 if __name__ == '__main__':
     # Lancement du serveur en mode Debug pour le développement
+    # Sans reverse-proxy, le navigateur (sur ce poste) se connecte directement au flux SSE
+    SSE_ACTIF = True
+    if URL_SSE is None: URL_SSE = f"http://127.0.0.1:{PORT_SSE}/tv/stream"
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
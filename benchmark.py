@@ -0,0 +1,336 @@
+"""
+Banc d'essai de SalleDispo sur un campus synthétique.
+
+Génère un dossier de type salleICS/ (nombre de salles, cours par salle, part de séries
+RRULE et de journées entières réglables) avec son config.json et son reports.json, puis
+mesure les routes Flask (client de test) et les fonctions métier : percentiles de latence,
+débit et pic mémoire. Les résultats sont enregistrés en JSON pour comparer deux versions.
+
+L'application mesurée (app.py et templates/) est copiée dans le campus puis importée de là :
+config.json, reports.json et salleICS/ sont ceux du campus sans toucher aux variables internes
+du module. Le banc tourne donc aussi sur une révision plus ancienne (--app) ; les routes et
+fonctions absentes de cette révision sont simplement ignorées.
+
+    git worktree add /tmp/salledispo_avant <révision>
+    python benchmark.py --salles 300 --evenements 400 --app /tmp/salledispo_avant --sortie benchmark_avant.json
+    python benchmark.py --salles 300 --evenements 400 --comparer benchmark_avant.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Avant l'import de l'application : pas de flux SSE ni de snapshot disque pendant les mesures
+os.environ.setdefault('SALLEDISPO_PORT_SSE', '0')
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+
+salledispo = None # Module app importé depuis le campus (voir importer_application)
+
+# =========================================================
+# 🏗️ GÉNÉRATION DU CAMPUS SYNTHÉTIQUE
+# =========================================================
+
+VTIMEZONE_PARIS = """BEGIN:VTIMEZONE
+TZID:Europe/Paris
+BEGIN:DAYLIGHT
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU
+END:DAYLIGHT
+BEGIN:STANDARD
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU
+END:STANDARD
+END:VTIMEZONE"""
+
+MATIERES = ["Algorithmique", "Bases de données", "Réseaux", "Anglais", "Mathématiques",
+            "Systèmes", "Développement Web", "Gestion de projet", "Communication", "Physique"]
+
+def generer_ics(aleatoire, nb_evenements, part_rrule, part_journee, jour_zero):
+    """Contenu d'un fichier ICS : cours ponctuels, séries hebdomadaires et journées entières."""
+    lignes = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//SalleDispo//Banc d'essai//FR", VTIMEZONE_PARIS]
+    for k in range(nb_evenements):
+        jour = jour_zero + timedelta(days=aleatoire.randint(-30, 120))
+        titre = f"{aleatoire.choice(MATIERES)} - Groupe {aleatoire.randint(1, 12)}"
+        lignes += ["BEGIN:VEVENT", f"UID:bench-{k}@salledispo", f"SUMMARY:{titre}"]
+        tirage = aleatoire.random()
+        if tirage < part_journee:
+            lignes += [f"DTSTART;VALUE=DATE:{jour:%Y%m%d}", f"DTEND;VALUE=DATE:{jour + timedelta(days=1):%Y%m%d}"]
+        else:
+            debut = datetime.combine(jour, datetime.min.time()) + timedelta(hours=aleatoire.randint(8, 17),
+                                                                            minutes=aleatoire.choice([0, 15, 30, 45]))
+            fin = debut + timedelta(minutes=aleatoire.choice([60, 90, 120, 180]))
+            lignes += [f"DTSTART;TZID=Europe/Paris:{debut:%Y%m%dT%H%M%S}", f"DTEND;TZID=Europe/Paris:{fin:%Y%m%dT%H%M%S}"]
+            if tirage < part_journee + part_rrule:
+                lignes.append(f"RRULE:FREQ=WEEKLY;COUNT={aleatoire.randint(6, 15)}")
+        lignes.append("END:VEVENT")
+    lignes.append("END:VCALENDAR")
+    return "\r\n".join(lignes) + "\r\n"
+
+def generer_campus(dossier, nb_salles, nb_evenements, part_rrule, part_journee, nb_incidents, graine):
+    """Crée salleICS/, config.json et reports.json dans 'dossier'. Retourne la liste des noms de salles."""
+    aleatoire = random.Random(graine)
+    jour_zero = datetime.now().date()
+    dossier_ics = os.path.join(dossier, "salleICS")
+    os.makedirs(dossier_ics, exist_ok=True)
+
+    noms, config = [], {"_README": "Configuration générée par benchmark.py"}
+    for i in range(nb_salles):
+        nom = f"{(i // 30) % 5}{i % 30:02d}" + (f"-{i // 150}" if i >= 150 else "")
+        noms.append(nom)
+        with open(os.path.join(dossier_ics, f"{nom}.ics"), 'w', encoding='utf-8', newline='') as f:
+            f.write(generer_ics(aleatoire, nb_evenements, part_rrule, part_journee, jour_zero))
+        config[nom] = {"nom_complet": f"Salle {nom}", "places": aleatoire.choice([16, 24, 30, 40]),
+                       "pc": aleatoire.random() < 0.5, "projecteur": aleatoire.random() < 0.7, "tableau": True,
+                       "etage": int(nom[0]), "aile": aleatoire.choice(["gauche", "droite"]),
+                       "description": "Salle générée pour le banc d'essai."}
+
+    incidents = {}
+    for _ in range(nb_incidents):
+        incidents.setdefault(aleatoire.choice(noms), []).append(
+            {"type": "Matériel Info", "desc": "Incident de test", "date": "01/01 à 08:00", "auteur": "bench"})
+
+    with open(os.path.join(dossier, "config.json"), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(dossier, "reports.json"), 'w', encoding='utf-8') as f:
+        json.dump(incidents, f, ensure_ascii=False, indent=1)
+    return noms
+
+def installer_application(dossier_app, dossier):
+    """
+    Copie app.py et templates/ de la version mesurée dans le campus : toutes les versions
+    cherchent config.json et reports.json à côté d'app.py, et salleICS/ dans le dossier courant.
+    """
+    shutil.copy(os.path.join(dossier_app, "app.py"), dossier)
+    shutil.copytree(os.path.join(dossier_app, "templates"), os.path.join(dossier, "templates"))
+
+def importer_application(dossier):
+    """Importe l'application copiée dans le campus (le dossier courant devient le campus)."""
+    global salledispo
+    os.chdir(dossier)
+    sys.path.insert(0, dossier)
+    import app
+    salledispo = app
+
+# =========================================================
+# ⏱️ MESURES
+# =========================================================
+
+def percentile(valeurs_triees, p):
+    """Percentile par interpolation linéaire sur une liste déjà triée."""
+    if not valeurs_triees: return None
+    position = (len(valeurs_triees) - 1) * p / 100
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs_triees) - 1)
+    return valeurs_triees[bas] + (valeurs_triees[haut] - valeurs_triees[bas]) * (position - bas)
+
+def mesurer(fonction, iterations, iterations_memoire):
+    """
+    Appelle 'fonction' 'iterations' fois (latences en ms), puis quelques fois sous tracemalloc
+    pour le pic mémoire (tracemalloc ralentit fortement : il n'est pas actif pendant le chronométrage).
+    """
+    latences = []
+    debut_total = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fonction(i)
+        latences.append((time.perf_counter() - t) * 1000)
+    duree_totale = time.perf_counter() - debut_total
+
+    tracemalloc.start()
+    for i in range(iterations_memoire):
+        fonction(i)
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latences.sort()
+    return {
+        "iterations": iterations,
+        "moyenne_ms": round(sum(latences) / len(latences), 3),
+        "p50_ms": round(percentile(latences, 50), 3),
+        "p90_ms": round(percentile(latences, 90), 3),
+        "p99_ms": round(percentile(latences, 99), 3),
+        "max_ms": round(latences[-1], 3),
+        "debit_par_s": round(iterations / duree_totale, 1) if duree_totale else None,
+        "pic_memoire_ko": round(pic / 1024, 1),
+    }
+
+# Exécuté dans un processus neuf (dossier courant = campus) : import, connexion et première page
+DEMARRAGE = """
+import json, sys, time, tracemalloc
+if sys.argv[1] == '1': tracemalloc.start()
+t = time.perf_counter()
+import app
+t_import = time.perf_counter()
+client = app.app.test_client()
+client.post('/login', data={'username': 'admin', 'password': 'admin'})
+if client.get('/').status_code >= 400: raise SystemExit("première page en erreur")
+t_page = time.perf_counter()
+pic = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+print(json.dumps({"import_ms": (t_import - t) * 1000, "premiere_page_ms": (t_page - t_import) * 1000, "pic": pic}))
+"""
+
+def demarrer_processus(dossier, suivi_memoire):
+    sortie = subprocess.run([sys.executable, "-c", DEMARRAGE, "1" if suivi_memoire else "0"], cwd=dossier,
+                            capture_output=True, text=True, check=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+def mesurer_demarrage(dossier):
+    """
+    Démarrage à froid dans un processus neuf : import de l'application, puis première page
+    (parsing de tous les fichiers). Passe chronométrée, puis passe sous tracemalloc pour le pic mémoire.
+    """
+    chrono = demarrer_processus(dossier, False)
+    memoire = demarrer_processus(dossier, True)
+    return {"duree_ms": round(chrono["import_ms"] + chrono["premiere_page_ms"], 1),
+            "import_ms": round(chrono["import_ms"], 1), "premiere_page_ms": round(chrono["premiere_page_ms"], 1),
+            "duree_sous_tracemalloc_ms": round(memoire["import_ms"] + memoire["premiere_page_ms"], 1),
+            "pic_memoire_ko": round(memoire["pic"] / 1024, 1)}
+
+class ScenarioAbsent(Exception):
+    """Route ou fonction absente de la version mesurée : le scénario est ignoré."""
+
+def scenarios(client, noms, aleatoire):
+    """Scénarios mesurés : nom -> fonction(i)."""
+    fichiers = [f"{nom}.ics" for nom in noms]
+    maintenant = datetime.now(salledispo.pytz.timezone('Europe/Paris'))
+
+    def route(url_ou_generateur):
+        def appel(i):
+            url = url_ou_generateur(i) if callable(url_ou_generateur) else url_ou_generateur
+            reponse = client.get(url)
+            if reponse.status_code == 404 and i == 0: raise ScenarioAbsent(url)
+            if reponse.status_code >= 400: raise RuntimeError(f"{url} -> {reponse.status_code}")
+        return appel
+
+    def fonction(nom, arguments):
+        """Appel d'une fonction métier commune à toutes les versions (si elle existe dans celle-ci)."""
+        def appel(i):
+            cible = getattr(salledispo, nom, None)
+            if cible is None: raise ScenarioAbsent(nom)
+            cible(*arguments(i))
+        return appel
+
+    def creneau(i):
+        debut = maintenant + timedelta(minutes=15 * aleatoire.randint(0, 4 * 24 * 7))
+        return aleatoire.choice(fichiers), debut, debut + timedelta(hours=2)
+
+    signaler = fonction("add_report", lambda i: (aleatoire.choice(noms), "Matériel Info", f"Incident {i}"))
+    def signalement(i):
+        with salledispo.app.test_request_context():
+            signaler(i)
+
+    return {
+        "route /": route('/'),
+        "route / (filtres)": route(lambda i: f"/?pc=on&etage={i % 5}&duree_min=60"),
+        "route /tv": route('/tv'),
+        "route /salle/<f>": route(lambda i: f"/salle/{aleatoire.choice(fichiers)}"),
+        "route /api/status": route('/api/status'),
+        "route /api/creneaux-libres": route('/api/creneaux-libres?duree_min=120'),
+        "route /occupation": route('/occupation?jours=7'),
+        "verifier_dispo_creneau": fonction("verifier_dispo_creneau", creneau),
+        "get_salle_status": fonction("get_salle_status", lambda i: (aleatoire.choice(fichiers),)),
+        "get_planning_etendu": fonction("get_planning_etendu", lambda i: (aleatoire.choice(fichiers),)),
+        "add_report": signalement,
+    }
+
+def comparer(actuel, reference):
+    """Affiche l'évolution du p50 et du pic mémoire par rapport à un résultat précédent."""
+    print(f"\n{'Comparaison avec ' + reference['date']:<40}{'p50':>14}{'mémoire':>14}")
+    for nom, mesure in actuel["resultats"].items():
+        ancienne = reference["resultats"].get(nom)
+        if not ancienne or "p50_ms" not in mesure: continue
+        ratio_p50 = mesure["p50_ms"] / ancienne["p50_ms"] if ancienne["p50_ms"] else float('nan')
+        ratio_mem = mesure["pic_memoire_ko"] / ancienne["pic_memoire_ko"] if ancienne["pic_memoire_ko"] else float('nan')
+        alerte = "  ⚠️" if ratio_p50 > 1.2 else ""
+        print(f"{nom:<40}{ratio_p50:>13.2f}x{ratio_mem:>13.2f}x{alerte}")
+
+# =========================================================
+# 🚀 POINT D'ENTRÉE
+# =========================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai SalleDispo sur un campus synthétique.")
+    parser.add_argument('--salles', type=int, default=100, help="Nombre de salles (défaut : 100)")
+    parser.add_argument('--evenements', type=int, default=300, help="Cours par salle (défaut : 300)")
+    parser.add_argument('--rrule', type=float, default=0.1, help="Part des cours en série hebdomadaire RRULE (défaut : 0.1)")
+    parser.add_argument('--journee', type=float, default=0.02, help="Part des événements sur la journée entière (défaut : 0.02)")
+    parser.add_argument('--incidents', type=int, default=200, help="Incidents dans reports.json (défaut : 200)")
+    parser.add_argument('--iterations', type=int, default=200, help="Appels chronométrés par scénario (défaut : 200)")
+    parser.add_argument('--iterations-memoire', type=int, default=10, help="Appels sous tracemalloc par scénario (défaut : 10)")
+    parser.add_argument('--graine', type=int, default=42, help="Graine aléatoire (défaut : 42)")
+    parser.add_argument('--sortie', default='benchmark.json', help="Fichier JSON de résultats (défaut : benchmark.json)")
+    parser.add_argument('--comparer', help="Résultats JSON d'une version précédente à comparer")
+    parser.add_argument('--app', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Dossier de la version mesurée (app.py, templates/), ex. un git worktree (défaut : ce dossier)")
+    parser.add_argument('--garder', action='store_true', help="Conserver le campus généré (chemin affiché)")
+    args = parser.parse_args()
+
+    # Référence lue avant toute mesure : --comparer peut désigner le même fichier que --sortie
+    reference = None
+    if args.comparer:
+        with open(args.comparer, encoding='utf-8') as f:
+            reference = json.load(f)
+    args.sortie = os.path.abspath(args.sortie) # Les mesures se font depuis le dossier du campus
+
+    depart = os.getcwd()
+    dossier = tempfile.mkdtemp(prefix="salledispo_bench_")
+    try:
+        print(f"🏗️  Génération : {args.salles} salles x {args.evenements} cours dans {dossier}")
+        t = time.perf_counter()
+        noms = generer_campus(dossier, args.salles, args.evenements, args.rrule, args.journee, args.incidents, args.graine)
+        print(f"   ({time.perf_counter() - t:.1f} s)")
+        installer_application(args.app, dossier)
+
+        resultats = {"demarrage_froid": mesurer_demarrage(dossier)}
+        print(f"{'demarrage_froid':<40}{resultats['demarrage_froid']['duree_ms']:>10.1f} ms")
+        importer_application(dossier)
+
+        client = salledispo.app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin'})
+        aleatoire = random.Random(args.graine)
+        print(f"\n{'Scénario':<40}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'pic Ko':>10}")
+        for nom, fonction in scenarios(client, noms, aleatoire).items():
+            try:
+                mesure = mesurer(fonction, args.iterations, args.iterations_memoire)
+            except ScenarioAbsent:
+                print(f"{nom:<40}{'(absent de cette version)':>30}")
+                continue
+            resultats[nom] = mesure
+            print(f"{nom:<40}{mesure['p50_ms']:>10.2f}{mesure['p90_ms']:>10.2f}{mesure['p99_ms']:>10.2f}"
+                  f"{mesure['debit_par_s']:>10.0f}{mesure['pic_memoire_ko']:>10.0f}")
+
+        sortie = {
+            "date": datetime.now().isoformat(timespec='seconds'),
+            "python": sys.version.split()[0],
+            "plateforme": platform.platform(),
+            "parametres": {k: v for k, v in vars(args).items() if k not in ('sortie', 'comparer', 'garder', 'app')},
+            "cache_ics": salledispo.CACHE_ICS.stats() if hasattr(salledispo, 'CACHE_ICS') else None,
+            "resultats": resultats,
+        }
+        with open(args.sortie, 'w', encoding='utf-8') as f:
+            json.dump(sortie, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Résultats enregistrés dans {args.sortie}")
+
+        if reference is not None:
+            comparer(sortie, reference)
+    finally:
+        os.chdir(depart)
+        if args.garder:
+            print(f"📁 Campus conservé : {dossier}")
+        else:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Synchronisation des flux ICS distants (SynchroFlux) contre un serveur HTTP local.
+
+    python -m unittest discover tests
+"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+
+# Avant l'import de l'application : pas de snapshot disque pendant les tests
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as salledispo
+
+ICS = (b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nDTSTART:20300101T100000Z\r\nDTEND:20300101T120000Z\r\n"
+       b"SUMMARY:%s\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n")
+
+class ServeurPlanning(BaseHTTPRequestHandler):
+    """Faux serveur de planning : ETag / 304, gzip, redirection, panne avec Retry-After."""
+    protocol_version = "HTTP/1.1"
+    contenus = {}
+    requetes = []
+    connexions = set()
+
+    def log_message(self, *args): pass
+
+    def repondre(self, statut, corps=b"", **entetes):
+        self.send_response(statut)
+        for nom, valeur in entetes.items(): self.send_header(nom.replace('_', '-'), valeur)
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def do_GET(self):
+        self.requetes.append((self.path, self.headers.get("If-None-Match")))
+        self.connexions.add(self.client_address)
+        if self.path == "/panne.ics":
+            return self.repondre(503, Retry_After="7")
+        if self.path == "/ancien.ics":
+            return self.repondre(302, Location="/103.ics")
+        if self.path == "/bombe.ics":
+            return self.repondre(200, gzip.compress(b"\0" * 100_000), Content_Encoding="gzip")
+        corps = self.contenus[self.path]
+        etag = f'"{len(corps)}-{hash(corps)}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.repondre(304, ETag=etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            return self.repondre(200, gzip.compress(corps), ETag=etag, Content_Encoding="gzip")
+        self.repondre(200, corps, ETag=etag)
+
+class TestSynchroFlux(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.serveur = ThreadingHTTPServer(("127.0.0.1", 0), ServeurPlanning)
+        threading.Thread(target=cls.serveur.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.serveur.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.serveur.shutdown()
+        cls.serveur.server_close()
+
+    def setUp(self):
+        ServeurPlanning.contenus = {f"/{n}.ics": ICS % f"Cours {n}".encode() for n in ("103", "104", "105")}
+        ServeurPlanning.requetes = []
+        ServeurPlanning.connexions = set()
+        self.dossier = tempfile.mkdtemp(prefix="salledispo_flux_")
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        self.dossier_ics = os.path.join(self.dossier, "salleICS")
+
+    def synchro(self, salles, **reglages):
+        config = os.path.join(self.dossier, "flux.json")
+        with open(config, 'w', encoding='utf-8') as f:
+            json.dump({"salles": {nom: self.base + chemin for nom, chemin in salles.items()}, **reglages}, f)
+        return salledispo.SynchroFlux(config, self.dossier_ics)
+
+    def lire(self, nom):
+        with open(os.path.join(self.dossier_ics, f"{nom}.ics"), 'rb') as f:
+            return f.read()
+
+    def test_premier_cycle_ecrit_tous_les_flux(self):
+        synchro = self.synchro({"103": "/103.ics", "104": "/104.ics", "105": "/105.ics"})
+        bilan = synchro.synchroniser()
+        self.assertEqual(bilan["modifie"], 3)
+        for nom in ("103", "104", "105"):
+            self.assertEqual(self.lire(nom), ServeurPlanning.contenus[f"/{nom}.ics"]) # Corps gzip décompressé
+        self.assertEqual([f for f in os.listdir(self.dossier_ics) if f.endswith('.tmp')], [])
+
+    def test_flux_inchanges_304_sans_reecriture(self):
+        synchro = self.synchro({"103": "/103.ics", "104": "/104.ics"})
+        synchro.synchroniser()
+        mtime = os.stat(os.path.join(self.dossier_ics, "103.ics")).st_mtime_ns
+        connexions = len(ServeurPlanning.connexions)
+
+        bilan = synchro.synchroniser()
+        self.assertEqual(bilan["inchange"], 2)
+        self.assertEqual(os.stat(os.path.join(self.dossier_ics, "103.ics")).st_mtime_ns, mtime)
+        self.assertTrue(all(etag for _, etag in ServeurPlanning.requetes[2:])) # GET conditionnels
+        self.assertEqual(len(ServeurPlanning.connexions), connexions) # Connexions keep-alive réutilisées
+
+        ServeurPlanning.contenus["/103.ics"] = ICS % b"Cours 103 (modifie)"
+        self.assertEqual(synchro.synchroniser()["modifie"], 1)
+        self.assertIn(b"(modifie)", self.lire("103"))
+
+    def test_redirection_suivie(self):
+        synchro = self.synchro({"103": "/ancien.ics"})
+        self.assertEqual(synchro.synchroniser()["modifie"], 1)
+        self.assertEqual(self.lire("103"), ServeurPlanning.contenus["/103.ics"])
+
+    def test_panne_backoff_et_retry_after(self):
+        synchro = self.synchro({"103": "/103.ics", "404": "/panne.ics"})
+        with mock.patch.object(salledispo, 'journaliser_erreur'):
+            bilan = synchro.synchroniser()
+        self.assertEqual((bilan["modifie"], bilan["erreur"]), (1, 1))
+        self.assertGreaterEqual(synchro._etats["404"]["prochain_essai"], time.time() + 6)
+        self.assertEqual(synchro.synchroniser()["reporte"], 1) # Pas de nouvel essai avant le délai
+
+    def test_bombe_gzip_refusee(self):
+        synchro = self.synchro({"103": "/bombe.ics"})
+        with mock.patch.object(salledispo, 'TAILLE_MAX_FLUX', 10_000), \
+             mock.patch.object(salledispo, 'journaliser_erreur'):
+            self.assertEqual(synchro.synchroniser()["erreur"], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.dossier_ics, "103.ics")))
+
+    def test_reglages_invalides_remplaces_par_defaut(self):
+        synchro = self.synchro({"103": "/103.ics"}, intervalle_secondes="5 min", connexions_max=0)
+        with mock.patch.object(salledispo, 'journaliser_erreur') as journal:
+            intervalle, connexions_max, _ = synchro.lire_config()
+        self.assertEqual((intervalle, connexions_max), (salledispo.INTERVALLE_FLUX, salledispo.CONNEXIONS_MAX_FLUX))
+        self.assertEqual(journal.call_count, 2)
+
+    def test_nom_de_salle_invalide_ignore(self):
+        synchro = self.synchro({"../103": "/103.ics"})
+        with mock.patch.object(salledispo, 'journaliser_erreur'):
+            self.assertEqual(synchro.synchroniser()["modifie"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
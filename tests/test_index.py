@@ -0,0 +1,101 @@
+"""
+Index d'intervalles d'une salle (IndexSalle) : en_cours, prochain, chevauche et entre,
+comparés à une recherche exhaustive.
+
+    python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import unittest
+from array import array
+
+# Avant l'import de l'application : pas de snapshot disque pendant les tests
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as salledispo
+
+def index(*evenements):
+    """IndexSalle à partir de (debut, fin) ; fin = debut pour un événement ponctuel (sans DTEND)."""
+    evenements = sorted(evenements, key=lambda e: e[0])
+    return salledispo.IndexSalle(array('q', [d for d, _ in evenements]), array('q', [f for _, f in evenements]),
+                                 [f"Cours {d}-{f}" for d, f in evenements])
+
+# Recherches exhaustives de référence
+def en_cours_naif(idx, t):
+    return next((k for k in range(len(idx)) if idx.debuts[k] <= t <= idx.fins[k] and idx.debuts[k] < idx.fins[k]), None)
+
+def prochain_naif(idx, t):
+    return next((k for k in range(len(idx)) if idx.debuts[k] > t and idx.debuts[k] < idx.fins[k]), None)
+
+def chevauche_naif(idx, debut, fin):
+    return any(idx.debuts[k] < fin and idx.fins[k] > debut and idx.debuts[k] < idx.fins[k] for k in range(len(idx)))
+
+def entre_naif(idx, debut, fin):
+    return [k for k in range(len(idx)) if idx.fins[k] > debut and idx.debuts[k] < fin]
+
+class TestIndexSalle(unittest.TestCase):
+
+    def test_index_vide(self):
+        idx = index()
+        self.assertIsNone(idx.en_cours(100))
+        self.assertIsNone(idx.prochain(100))
+        self.assertFalse(idx.chevauche(0, 1000))
+        self.assertEqual(idx.entre(0, 1000), [])
+
+    def test_bornes_incluses_pour_en_cours(self):
+        idx = index((100, 200))
+        self.assertEqual(idx.en_cours(100), 0)
+        self.assertEqual(idx.en_cours(200), 0)
+        self.assertIsNone(idx.en_cours(99))
+        self.assertIsNone(idx.en_cours(201))
+
+    def test_creneaux_adjacents_sans_chevauchement(self):
+        idx = index((100, 200), (200, 300))
+        self.assertFalse(idx.chevauche(300, 400)) # Créneau qui commence à la fin du dernier cours
+        self.assertFalse(idx.chevauche(0, 100))   # Créneau qui finit au début du premier cours
+        self.assertTrue(idx.chevauche(199, 201))
+        self.assertEqual(idx.entre(200, 300), [1])
+        self.assertEqual(idx.prochain(100), 1)
+        self.assertIsNone(idx.prochain(200))
+
+    def test_evenements_ponctuels_n_occupent_pas_la_salle(self):
+        idx = index((100, 100), (150, 150), (300, 400))
+        self.assertEqual(list(idx.fin_max), [salledispo.FIN_AUCUNE, salledispo.FIN_AUCUNE, 400])
+        self.assertIsNone(idx.en_cours(100))
+        self.assertFalse(idx.chevauche(50, 200))
+        self.assertEqual(idx.prochain(0), 2)
+        self.assertEqual(idx.entre(50, 200), [0, 1]) # Toujours affichés au planning
+
+    def test_long_evenement_englobant(self):
+        # Journée d'examen qui contient deux cours plus courts, puis un cours après elle
+        idx = index((0, 1000), (100, 200), (300, 400), (1500, 1600))
+        self.assertEqual(list(idx.fin_max), [1000, 1000, 1000, 1600])
+        self.assertEqual(idx.en_cours(250), 0) # Entre les deux cours imbriqués
+        self.assertEqual(idx.en_cours(150), 0) # Le premier commencé l'emporte
+        self.assertTrue(idx.chevauche(500, 600))
+        self.assertEqual(idx.entre(500, 600), [0])
+        self.assertEqual(idx.entre(350, 1550), [0, 2, 3])
+        self.assertIsNone(idx.en_cours(1200))
+
+    def test_comparaison_recherche_exhaustive(self):
+        alea = random.Random(2024)
+        for _ in range(300):
+            evenements = []
+            for _ in range(alea.randint(0, 25)):
+                debut = alea.randint(0, 100)
+                duree = alea.choice([0, 0, alea.randint(1, 10), alea.randint(1, 80)])
+                evenements.append((debut, debut + duree))
+            idx = index(*evenements)
+            for t in range(-2, 185):
+                self.assertEqual(idx.en_cours(t), en_cours_naif(idx, t), (evenements, t))
+                self.assertEqual(idx.prochain(t), prochain_naif(idx, t), (evenements, t))
+            for _ in range(40):
+                debut = alea.randint(-5, 185)
+                fin = debut + alea.randint(0, 40)
+                self.assertEqual(idx.chevauche(debut, fin), chevauche_naif(idx, debut, fin), (evenements, debut, fin))
+                self.assertEqual(idx.entre(debut, fin), entre_naif(idx, debut, fin), (evenements, debut, fin))
+
+if __name__ == '__main__':
+    unittest.main()
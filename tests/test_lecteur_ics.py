@@ -0,0 +1,75 @@
+"""
+Lecteur ICS en flux et repli icalendar : les deux chemins doivent produire les mêmes
+événements (dates normalisées, titres déséchappés selon la RFC 5545).
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Avant l'import de l'application : pas de snapshot disque pendant les tests
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as salledispo
+
+VEVENTS = "\r\n".join([
+    "BEGIN:VEVENT", "DTSTART:20300107T080000Z", "DTEND:20300107T100000Z",
+    r"SUMMARY:Réseaux\, Télécoms\; TD", "END:VEVENT",
+    "BEGIN:VEVENT", "DTSTART;TZID=Europe/Paris:20300107T101500", "DTEND;TZID=Europe/Paris:20300107T121500",
+    r"SUMMARY:Java\nGroupe 2\NSalle B", "END:VEVENT",
+    "BEGIN:VEVENT", "DTSTART:20300108T080000Z", "DTEND:20300108T090000Z",
+    r"SUMMARY:Chemin C:\\temp\\new et \\n littéral", "END:VEVENT",
+    "BEGIN:VEVENT", "DTSTART:20300108T130000", "DTEND:20300108T150000",
+    "SUMMARY:Un titre très long replié sur plusieurs lignes pour vérifier le dépliage d",
+    " es lignes de continuation", "END:VEVENT",
+    "BEGIN:VEVENT", "DTSTART;VALUE=DATE:20300109", "DTEND;VALUE=DATE:20300110",
+    "SUMMARY:Journée portes ouvertes",
+    "BEGIN:VALARM", "ACTION:DISPLAY", "TRIGGER:-PT15M", "SUMMARY:Rappel (ignoré)", "END:VALARM",
+    "END:VEVENT",
+    "BEGIN:VEVENT", "DTSTART:20300110T080000Z", "END:VEVENT", # Sans DTEND ni SUMMARY
+])
+
+class TestPariteLecteurs(unittest.TestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp(prefix="salledispo_ics_")
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+
+    def ecrire(self, *parties):
+        chemin = os.path.join(self.dossier, "103.ics")
+        with open(chemin, 'w', encoding='utf-8') as f:
+            f.write("\r\n".join(["BEGIN:VCALENDAR", "VERSION:2.0", *parties, "END:VCALENDAR", ""]))
+        return chemin
+
+    def test_memes_evenements_par_les_deux_lecteurs(self):
+        chemin = self.ecrire(VEVENTS)
+        flux = salledispo.lire_calendrier_flux(chemin)
+        evenements, recurrences = salledispo.lire_calendrier_icalendar(chemin)
+        self.assertEqual(recurrences, [])
+        self.assertEqual(flux, evenements)
+        self.assertEqual([ev.titre for ev in flux], [
+            "Réseaux, Télécoms; TD",
+            "Java\nGroupe 2\nSalle B",
+            "Chemin C:\\temp\\new et \\n littéral",
+            "Un titre très long replié sur plusieurs lignes pour vérifier le dépliage des lignes de continuation",
+            "Journée portes ouvertes",
+            "None",
+        ])
+
+    def test_titre_d_une_serie_desechappe_comme_en_flux(self):
+        # Une RRULE force le repli icalendar pour tout le fichier
+        chemin = self.ecrire(VEVENTS, "\r\n".join([
+            "BEGIN:VEVENT", "UID:serie@test", "DTSTART:20300107T140000Z", "DTEND:20300107T160000Z",
+            "RRULE:FREQ=WEEKLY;COUNT=4", r"SUMMARY:TP\, groupe A\\B", "END:VEVENT"]))
+        with self.assertRaises(salledispo.ContenuIcsExotique):
+            salledispo.lire_calendrier_flux(chemin)
+        evenements, recurrences = salledispo.lire_calendrier_icalendar(chemin)
+        self.assertEqual(evenements, salledispo.lire_calendrier_flux(self.ecrire(VEVENTS)))
+        self.assertEqual([r.titre for r in recurrences], ["TP, groupe A\\B"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Séries récurrentes d'une salle (CalendrierSalle) : développement paresseux jour par jour,
+EXDATE et cours en cours à cheval sur minuit, à partir d'un petit ICS écrit à la volée.
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import pytz
+
+# Avant l'import de l'application : pas de snapshot disque pendant les tests
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as salledispo
+
+TZ = pytz.timezone('Europe/Paris')
+
+def instant(jour, heure, minute=0):
+    """Epoch d'une heure murale à Paris."""
+    return int(TZ.localize(datetime.combine(jour, datetime.min.time()).replace(hour=heure, minute=minute)).timestamp())
+
+def ics_local(jour, heure):
+    return f"{jour:%Y%m%d}T{heure:02d}0000"
+
+class TestCalendrierRecurrent(unittest.TestCase):
+
+    def setUp(self):
+        # Séries centrées sur aujourd'hui : le développement est borné à l'horizon autour de maintenant
+        self.j0 = datetime.now(TZ).date() - timedelta(days=3)
+        self.annule = self.j0 + timedelta(days=2)
+        ics = "\r\n".join([
+            "BEGIN:VCALENDAR", "VERSION:2.0",
+            "BEGIN:VEVENT", "UID:td@test",
+            f"DTSTART;TZID=Europe/Paris:{ics_local(self.j0, 8)}",
+            f"DTEND;TZID=Europe/Paris:{ics_local(self.j0, 10)}",
+            "RRULE:FREQ=DAILY;COUNT=10",
+            f"EXDATE;TZID=Europe/Paris:{ics_local(self.annule, 8)}",
+            "SUMMARY:TD quotidien", "END:VEVENT",
+            "BEGIN:VEVENT", "UID:nuit@test",
+            f"DTSTART;TZID=Europe/Paris:{ics_local(self.j0, 22)}",
+            "DURATION:PT4H",
+            "RRULE:FREQ=WEEKLY;COUNT=3",
+            "SUMMARY:Observation de nuit", "END:VEVENT",
+            "END:VCALENDAR", ""])
+        self.dossier = tempfile.mkdtemp(prefix="salledispo_rrule_")
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        chemin = os.path.join(self.dossier, "103.ics")
+        with open(chemin, 'w', encoding='utf-8') as f:
+            f.write(ics)
+        self.calendrier = salledispo.charger_calendrier(chemin)
+
+    def test_series_gardees_sous_forme_de_regles(self):
+        self.assertEqual(len(self.calendrier.index), 0)
+        self.assertEqual(len(self.calendrier.recurrences), 2)
+        self.assertEqual(len(self.calendrier._jours), 0) # Rien n'est développé avant la première question
+
+    def test_developpement_limite_aux_jours_interroges(self):
+        jour = self.j0 + timedelta(days=1)
+        courant = self.calendrier.en_cours(instant(jour, 9))
+        self.assertEqual(courant, (instant(jour, 8), instant(jour, 10), "TD quotidien"))
+        self.assertEqual(set(self.calendrier._jours), {jour})
+        # Avant 4 h, la veille est aussi développée : un cours de 4 h peut en déborder
+        self.calendrier.en_cours(instant(jour + timedelta(days=1), 1))
+        self.assertEqual(set(self.calendrier._jours), {jour, jour + timedelta(days=1)})
+
+    def test_occurrence_exclue_par_exdate(self):
+        self.assertIsNone(self.calendrier.en_cours(instant(self.annule, 9)))
+        self.assertFalse(self.calendrier.chevauche(instant(self.annule, 8), instant(self.annule, 10)))
+        debut_jour = salledispo._debut_jour(self.annule, TZ)
+        self.assertEqual(self.calendrier.entre(debut_jour, debut_jour + 86400), [])
+        lendemain = self.annule + timedelta(days=1)
+        self.assertTrue(self.calendrier.chevauche(instant(lendemain, 9), instant(lendemain, 9, 30)))
+
+    def test_cours_en_cours_a_cheval_sur_minuit(self):
+        lendemain = self.j0 + timedelta(days=1)
+        nuit = (instant(self.j0, 22), instant(self.j0, 22) + 4 * 3600, "Observation de nuit")
+        self.assertEqual(self.calendrier.en_cours(instant(lendemain, 1)), nuit)
+        self.assertTrue(self.calendrier.chevauche(instant(lendemain, 0, 30), instant(lendemain, 1)))
+        debut_jour = salledispo._debut_jour(lendemain, TZ)
+        self.assertEqual(self.calendrier.entre(debut_jour, debut_jour + 86400),
+                         [nuit, (instant(lendemain, 8), instant(lendemain, 10), "TD quotidien")])
+        self.assertIsNone(self.calendrier.en_cours(instant(lendemain, 3)))
+
+    def test_prochain_cours_toutes_series_confondues(self):
+        self.assertEqual(self.calendrier.prochain(instant(self.j0, 12))[2], "Observation de nuit")
+        self.assertEqual(self.calendrier.prochain(instant(self.j0, 23))[:2],
+                         (instant(self.j0 + timedelta(days=1), 8), instant(self.j0 + timedelta(days=1), 10)))
+        # Après l'occurrence annulée de 8 h, la suivante est celle du lendemain
+        self.assertEqual(self.calendrier.prochain(instant(self.annule, 7))[0],
+                         instant(self.annule + timedelta(days=1), 8))
+
+if __name__ == '__main__':
+    unittest.main()
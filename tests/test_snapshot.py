@@ -0,0 +1,142 @@
+"""
+Snapshot binaire des calendriers (MAGIC_SNAPSHOT_ICS) : aller-retour écriture / lecture mmap, et
+snapshot tronqué ou corrompu ignoré au profit d'un nouveau parsing des fichiers ICS.
+
+    python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytz
+
+# Avant l'import de l'application : pas de snapshot disque pendant les tests
+os.environ.setdefault('SALLEDISPO_SNAPSHOT_ICS', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as salledispo
+
+def vevent(debut, fin, titre, *lignes):
+    return "\r\n".join(["BEGIN:VEVENT", f"DTSTART:{debut:%Y%m%dT%H%M%SZ}", f"DTEND:{fin:%Y%m%dT%H%M%SZ}",
+                        *lignes, f"SUMMARY:{titre}", "END:VEVENT"])
+
+class TestSnapshotCalendriers(unittest.TestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp(prefix="salledispo_snap_")
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        self.snapshot = os.path.join(self.dossier, "calendriers.snap")
+        base = datetime.now(pytz.utc).replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        contenus = {
+            "103.ics": [vevent(base + timedelta(hours=h), base + timedelta(hours=h + 2), f"Cours {h}") for h in (0, 3, 26)]
+                       + [vevent(base, base + timedelta(days=3), "Semaine d'examens")],
+            "104.ics": [vevent(base + timedelta(hours=2), base + timedelta(hours=4), "Cours 3"), # Titre partagé avec 103
+                        vevent(base + timedelta(hours=5), base + timedelta(hours=6), "TP réseau\\, salle B",
+                               "RRULE:FREQ=DAILY;COUNT=5")],
+            "105.ics": [],
+        }
+        self.chemins = []
+        for fichier, evenements in contenus.items():
+            chemin = os.path.join(self.dossier, fichier)
+            with open(chemin, 'w', encoding='utf-8') as f:
+                f.write("\r\n".join(["BEGIN:VCALENDAR", *evenements, "END:VCALENDAR", ""]))
+            self.chemins.append(chemin)
+        self.debut = int(base.timestamp()) - 3600
+        self.fin = self.debut + 5 * 86400
+        self.addCleanup(self.oublier)
+
+    def oublier(self):
+        """Retire les calendriers du test de CACHE_ICS (partagé par tout le processus)."""
+        for chemin in self.chemins:
+            salledispo.CACHE_ICS._entrees.pop(os.path.abspath(chemin), None)
+        salledispo._SNAPSHOTS_MAPPES.pop(self.snapshot, None)
+
+    def ecrire(self):
+        entrees = []
+        for chemin in self.chemins:
+            calendrier = salledispo.CACHE_ICS.get(chemin)
+            entrees.append((os.path.basename(chemin), salledispo.CacheCalendriers.signature(chemin), calendrier))
+        salledispo.ecrire_snapshot_calendriers(self.snapshot, entrees)
+        attendu = {c: self.resume(salledispo.CACHE_ICS.get(c)) for c in self.chemins}
+        self.oublier()
+        return attendu
+
+    def resume(self, calendrier):
+        """Ce que l'application lit d'un calendrier sur la fenêtre du test."""
+        index = calendrier.index
+        return ([index.evenement(k) for k in range(len(index))], list(index.fin_max),
+                calendrier.entre(self.debut, self.fin), calendrier.recurrences)
+
+    def test_aller_retour(self):
+        attendu = self.ecrire()
+        self.assertEqual(salledispo.charger_snapshot_calendriers(self.snapshot, self.dossier), 3)
+        for chemin in self.chemins:
+            calendrier = salledispo.CACHE_ICS.entree(chemin)[1]
+            self.assertIsInstance(calendrier.index.titres, salledispo.TitresMappes) # Lu depuis le mmap
+            self.assertEqual(self.resume(calendrier), attendu[chemin])
+
+    def test_fichier_modifie_non_repris(self):
+        self.ecrire()
+        with open(self.chemins[0], 'a', encoding='utf-8') as f:
+            f.write("\r\n")
+        self.assertEqual(salledispo.charger_snapshot_calendriers(self.snapshot, self.dossier), 2)
+        self.assertIsNone(salledispo.CACHE_ICS.entree(self.chemins[0]))
+
+    def corrompre(self, modifier_entete=None, tronquer=0):
+        """Réécrit le snapshot avec un en-tête modifié et/ou des données tronquées."""
+        with open(self.snapshot, 'rb') as f:
+            donnees = f.read()
+        magic = len(salledispo.MAGIC_SNAPSHOT_ICS)
+        (longueur,) = struct.unpack_from('<Q', donnees, magic)
+        entete, corps = json.loads(donnees[magic + 8:magic + 8 + longueur]), donnees[magic + 8 + longueur:]
+        if modifier_entete: modifier_entete(entete)
+        brut = json.dumps(entete).encode('utf-8')
+        brut += b" " * (-(magic + 8 + len(brut)) % 8)
+        corps = corps[:len(corps) - tronquer]
+        with open(self.snapshot, 'wb') as f:
+            f.write(donnees[:magic] + struct.pack('<Q', len(brut)) + brut + corps)
+
+    def verifier_ignore(self):
+        """Snapshot rejeté sans rien insérer, puis fichiers re-parsés normalement."""
+        with mock.patch.object(salledispo, 'journaliser_erreur') as journal:
+            self.assertEqual(salledispo.charger_snapshot_calendriers(self.snapshot, self.dossier), 0)
+        self.assertEqual(journal.call_args[0][0], "snapshot_ics")
+        for chemin in self.chemins:
+            self.assertIsNone(salledispo.CACHE_ICS.entree(chemin))
+        self.assertEqual(salledispo.charger_en_masse(self.chemins, nb_processus=1), 3)
+        self.assertEqual(salledispo.CACHE_ICS.get(self.chemins[0]).en_cours(self.debut + 3600 + 60)[2], "Cours 0")
+
+    def test_snapshot_tronque(self):
+        self.ecrire()
+        self.corrompre(tronquer=5)
+        self.verifier_ignore()
+
+    def test_plage_de_salle_hors_des_colonnes(self):
+        self.ecrire()
+        def deborder(entete): entete["salles"][1]["nb"] += 10
+        self.corrompre(deborder)
+        self.verifier_ignore()
+
+    def test_colonnes_de_longueurs_differentes(self):
+        self.ecrire()
+        def raccourcir(entete): entete["colonnes"]["ids"][1] -= 4
+        self.corrompre(raccourcir)
+        self.verifier_ignore()
+
+    def test_numero_de_titre_hors_table(self):
+        self.ecrire()
+        def retirer_titre(entete):
+            # Table des titres amputée de sa dernière entrée : le dernier n° de titre n'existe plus
+            position, taille = entete["colonnes"]["offsets"]
+            entete["colonnes"]["offsets"] = [position, taille - 8]
+        self.corrompre(retirer_titre)
+        self.verifier_ignore()
+
+if __name__ == '__main__':
+    unittest.main()